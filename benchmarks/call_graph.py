@@ -0,0 +1,71 @@
+"""
+Name lookup and depth query latency on a synthetic call graph, plus its save/load time and size on disk.
+
+Usage: python benchmarks/call_graph.py [--nodes <n>] [--edges-per-node <k>] [--depth <d>]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from code_context.call_graph import CallGraph, CallGraphBuilder
+
+
+def build_synthetic_graph(nodes: int, edges_per_node: int, files: int) -> CallGraph:
+    rng = random.Random(0)
+    builder = CallGraphBuilder()
+    for i in range(nodes):
+        builder.add_node(f"file:///project/module_{i % files}.py", f"f{i}", i, i + 10)
+    for i in range(nodes):
+        for _ in range(edges_per_node):
+            builder.add_edge(i, rng.randrange(nodes))
+    return builder.build()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=200_000)
+    parser.add_argument("--edges-per-node", type=int, default=4)
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    graph = build_synthetic_graph(args.nodes, args.edges_per_node, files=2000)
+    print(f"build: {time.perf_counter() - start:.2f} s")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "graph.ccg")
+        start = time.perf_counter()
+        graph.save(path)
+        print(f"save: {(time.perf_counter() - start) * 1000:.1f} ms")
+        print(f"size: {os.path.getsize(path) / 1e6:.1f} MB")
+        start = time.perf_counter()
+        graph = CallGraph.load(path)
+        print(f"load: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    rng = random.Random(1)
+    queries = [rng.randrange(args.nodes) for _ in range(args.queries)]
+    lookups = [(graph.span(node_id)[0], graph.names[node_id]) for node_id in queries]
+    start = time.perf_counter()
+    for uri, name in lookups:
+        graph.find(uri, name)
+    elapsed = time.perf_counter() - start
+    print(f"find: {elapsed / args.queries * 1e6:.1f} us")
+    reached = 0
+    start = time.perf_counter()
+    for node_id in queries:
+        reached += sum(len(level) for level in graph.reachable([node_id], args.depth))
+    elapsed = time.perf_counter() - start
+    print(
+        f"depth {args.depth} query: {elapsed / args.queries * 1e6:.1f} us"
+        f" (avg {reached / args.queries:.0f} nodes reached)"
+    )
+
+
+if __name__ == "__main__":
+    main()
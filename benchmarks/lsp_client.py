@@ -0,0 +1,67 @@
+"""
+Client side latency of a traversal against the replay server, so that it can be measured without jedi.
+
+Record a session first, with jedi running (python main.py start-jedi <root_dir>):
+    python main.py replay-server recording.json --record
+    python main.py lsp <file_path>::<function_name> <depth> --uri ws://localhost:2088
+
+Then replay it with a fixed injected latency:
+    python benchmarks/lsp_client.py recording.json <file_path>::<function_name> <depth> [--latency-ms <ms>]
+
+The recorded definition uris must exist on disk, so replay from the same checkout.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from code_context.ast_parsing import find_function_or_class_range
+from code_context.lsp_client import LSPWebSocketClient, get_depth_n_code_context
+from code_context.replay_server import LSPReplayServer
+
+PORT = 2089
+
+
+async def run(args):
+    file_name, function_name = args.target.split("::")
+    server = LSPReplayServer(
+        args.recording,
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+    )
+    server_task = asyncio.create_task(server.serve("localhost", PORT))
+    await asyncio.sleep(0.1)
+    timings = []
+    try:
+        for _ in range(args.runs):
+            node_info = find_function_or_class_range(file_name, function_name)
+            client = LSPWebSocketClient(f"ws://localhost:{PORT}")
+            await client.connect()
+            start = time.perf_counter()
+            context = await get_depth_n_code_context(client, [node_info], args.depth)
+            timings.append((time.perf_counter() - start) * 1000)
+            await client.close()
+    finally:
+        server_task.cancel()
+    print(f"snippets: {len(context)}")
+    print(f"min: {min(timings):.1f} ms, median: {statistics.median(timings):.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("recording")
+    parser.add_argument("target", help="<file_path>::<function_name>")
+    parser.add_argument("depth", type=int, nargs="?", default=1)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Peak RSS of a traversal at each depth, and of the worker processes parsing files for it, replaying a recorded session
+(see benchmarks/lsp_client.py for recording one).
+Every depth runs in a fresh process, so that the peaks do not carry over.
+
+Usage: python benchmarks/memory.py recording.json <file_path>::<function_name> [--max-depth <d>]
+"""
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+PORT = 2091
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF) -> float:
+    # ru_maxrss is in kilobytes on linux and bytes on macos
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(who).ru_maxrss * scale / 1e6
+
+
+async def traverse(target: str, depth: int):
+    from code_context.ast_parsing import find_function_or_class_range
+    from code_context.lsp_client import (
+        LSPWebSocketClient,
+        get_depth_n_code_context,
+        get_parse_pool,
+    )
+
+    file_name, function_name = target.split("::")
+    baseline = peak_rss_mb()
+    client = LSPWebSocketClient(f"ws://localhost:{PORT}")
+    await client.connect()
+    try:
+        node_info = find_function_or_class_range(file_name, function_name)
+        context = await get_depth_n_code_context(client, [node_info], depth)
+    finally:
+        await client.close()
+    # files are parsed in worker processes, whose peak is only reported once they have exited
+    get_parse_pool().shutdown()
+    print(
+        f"{depth:>6}{len(context):>10}{baseline:>14.1f}{peak_rss_mb():>14.1f}"
+        f"{peak_rss_mb(resource.RUSAGE_CHILDREN):>18.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("recording")
+    parser.add_argument("target", help="<file_path>::<function_name>")
+    parser.add_argument("--max-depth", type=int, default=4)
+    parser.add_argument("--child-depth", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child_depth is not None:
+        asyncio.run(traverse(args.target, args.child_depth))
+        return
+
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            "import asyncio, sys;"
+            "from code_context.replay_server import run_replay_server;"
+            f"asyncio.run(run_replay_server(sys.argv[1], False, None, {PORT}, 0.0, 0.0, 0))",
+            args.recording,
+        ],
+        cwd=ROOT_DIR,
+        stdout=subprocess.DEVNULL,
+    )
+    time.sleep(1)
+    try:
+        print(
+            f"{'depth':>6}{'snippets':>10}{'baseline MB':>14}{'peak MB':>14}"
+            f"{'worker peak MB':>18}"
+        )
+        for depth in range(1, args.max_depth + 1):
+            subprocess.run(
+                [sys.executable, __file__, args.recording, args.target]
+                + ["--child-depth", str(depth)],
+                check=True,
+            )
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Startup time of the CLI, measured as wall time until the process exits.
+Includes a trivial query answered from a saved call graph (see the graph command).
+
+The CLI runs from editor hooks, where interpreter start and imports are most of the latency.
+Each scenario has a budget in milliseconds; the script exits with status 1 if a median exceeds it.
+
+Usage: python benchmarks/startup.py [--runs <n>]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN = os.path.join(ROOT_DIR, "main.py")
+
+# (name, argv, budget in ms)
+SCENARIOS = [
+    ("interpreter", [sys.executable, "-c", "pass"], 50),
+    ("--help", [sys.executable, MAIN, "--help"], 150),
+    ("lsp --help", [sys.executable, MAIN, "lsp", "--help"], 150),
+    # everything a query imports before its first LSP request
+    (
+        "lsp import path",
+        [sys.executable, "-c", "import code_context.lsp_client"],
+        400,
+    ),
+]
+
+
+def graph_query_scenario(graph_path: str) -> tuple[str, list[str], int]:
+    """A trivial query answered from a saved call graph, i.e. a cache hit that never touches the language server."""
+    sys.path.insert(0, ROOT_DIR)
+    from code_context.ast_parsing import find_function_or_class_range
+    from code_context.call_graph import CallGraphBuilder
+
+    node_info = find_function_or_class_range(MAIN, "cli")
+    builder = CallGraphBuilder()
+    builder.add_node("file://" + MAIN, "cli", node_info.start_line, node_info.end_line)
+    builder.build().save(graph_path)
+    return (
+        "graph query",
+        [sys.executable, MAIN, "graph", graph_path, f"{MAIN}::cli", "1"],
+        150,
+    )
+
+
+def time_command(argv: list[str], runs: int) -> list[float]:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(argv, cwd=ROOT_DIR, stdout=subprocess.DEVNULL, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.TemporaryDirectory()
+    scenarios = SCENARIOS + [
+        graph_query_scenario(os.path.join(tmp_dir.name, "graph.ccg"))
+    ]
+    over_budget = False
+    print(f"{'scenario':<20}{'min ms':>10}{'median ms':>12}{'budget ms':>12}")
+    for name, argv, budget in scenarios:
+        timings = time_command(argv, args.runs)
+        median = statistics.median(timings)
+        flag = "" if median <= budget else "  OVER BUDGET"
+        over_budget |= median > budget
+        print(f"{name:<20}{min(timings):>10.1f}{median:>12.1f}{budget:>12}{flag}")
+    tmp_dir.cleanup()
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
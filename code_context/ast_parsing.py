@@ -1,14 +1,15 @@
 import ast
+from functools import lru_cache
 from typing import Optional
 from code_context.response_types import (
     ImportInfo,
     Range,
     Position,
     NodeInfo,
+    ObjectTypes,
     VisitedNode,
 )
 import builtins
-import importlib.util
 
 from code_context.utils import read_file_uri
 
@@ -21,14 +22,33 @@ def get_builtin_methods_for_types(*types) -> set[str]:
     return methods
 
 
-BUILTIN_METHODS = get_builtin_methods_for_types(str, dict, list, set, int, float, tuple)
+@lru_cache(maxsize=None)
+def get_builtin_methods() -> frozenset[str]:
+    """Methods of the common built-in types. Computed on first use rather than at import time."""
+    return frozenset(
+        get_builtin_methods_for_types(str, dict, list, set, int, float, tuple)
+    )
+
+
+@lru_cache(maxsize=None)
+def get_builtin_functions() -> frozenset[str]:
+    return frozenset(dir(builtins))
+
+
+def parse_file_uri(file_uri: str) -> ast.Module:
+    return ast.parse(read_file_uri(file_uri))
 
 
 def find_node_at_position(
     file_content: str, lsp_line_no: int, function_name: str
 ) -> Optional[ast.AST]:
     """Find the AST node at the given line and character number"""
-    tree = ast.parse(file_content)
+    return find_node_in_tree(ast.parse(file_content), lsp_line_no, function_name)
+
+
+def find_node_in_tree(
+    tree: ast.AST, lsp_line_no: int, function_name: str
+) -> Optional[ast.AST]:
     for node in ast.walk(tree):
         if hasattr(node, "lineno"):
             if node.lineno == (lsp_line_no + 1):
@@ -66,21 +86,66 @@ def find_node_at_position(
     return None
 
 
-def extract_code_segment(file_content, node):
-    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
-        # skips immediately preceding comments, as they are not part of the ast
-        start_line = node.lineno
-        if node.decorator_list:
-            start_line -= len(node.decorator_list)
-        end_line = node.end_lineno if hasattr(node, "end_lineno") else start_line
-    elif isinstance(node, ast.Assign):
-        start_line = node.lineno
-        end_line = start_line
-    else:
-        print("node returned None", node)
-        return None  # Or handle other types as needed
+DEFINITION_KINDS = {
+    ast.FunctionDef: ObjectTypes.FUNCTION,
+    ast.AsyncFunctionDef: ObjectTypes.ASYNC_FUNCTION,
+    ast.ClassDef: ObjectTypes.CLASS,
+}
+
+
+def get_decorator_offset(node) -> int:
+    """Number of lines the decorators of a definition start above it."""
+    if node.decorator_list:
+        return node.lineno - node.decorator_list[0].lineno
+    return 0
+
+
+def to_node_info(uri: str, node) -> NodeInfo:
+    """Extract the span of a function or class definition, so that its tree does not need to be kept alive."""
+    return NodeInfo(
+        uri=uri,
+        name=node.name,
+        kind=DEFINITION_KINDS[type(node)],
+        line=node.lineno,
+        character=node.col_offset,
+        end_line=node.end_lineno,
+        decorator_offset=get_decorator_offset(node),
+    )
+
+
+def find_definition_spans(file_uri: str) -> dict[int, tuple[str, str, int, int, int]]:
+    """{line: (name, kind, character, end_line, decorator_offset)} of the outermost function or class definition whose
+    def/class keyword is on each line. Plain tuples, cheap to send back from a worker process, unlike the tree."""
+    visitor = TopLevelVisitor(file_uri)
+    visitor.visit(parse_file_uri(file_uri))
+    spans: dict[int, tuple[str, str, int, int, int]] = {}
+    # visited outer before inner
+    for n in visitor.top_level_definitions:
+        spans.setdefault(
+            n.line, (n.name, n.kind.value, n.character, n.end_line, n.decorator_offset)
+        )
+    return spans
+
+
+def span_to_node_info(
+    file_uri: str, line: int, span: tuple[str, str, int, int, int]
+) -> NodeInfo:
+    name, kind, character, end_line, decorator_offset = span
+    return NodeInfo(
+        uri=file_uri,
+        name=name,
+        kind=ObjectTypes(kind),
+        line=line,
+        character=character,
+        end_line=end_line,
+        decorator_offset=decorator_offset,
+    )
+
+
+def extract_code_segment(file_content: str, node_info: NodeInfo) -> str:
+    # skips immediately preceding comments, as they are not part of the ast
     lines = file_content.splitlines()
-    return "\n".join(lines[start_line - 1 : end_line])
+    return "\n".join(lines[node_info.start_line - 1 : node_info.end_line])
 
 
 class TopLevelVisitor(ast.NodeVisitor):
@@ -89,30 +154,15 @@ class TopLevelVisitor(ast.NodeVisitor):
         self.top_level_definitions: list[NodeInfo] = []
 
     def visit_FunctionDef(self, node):
-        self.top_level_definitions.append(
-            NodeInfo(
-                uri=self.file_uri,
-                node=node,
-            )
-        )
+        self.top_level_definitions.append(to_node_info(self.file_uri, node))
         self.generic_visit(node)
 
     def visit_AsyncFunctionDef(self, node):
-        self.top_level_definitions.append(
-            NodeInfo(
-                uri=self.file_uri,
-                node=node,
-            )
-        )
+        self.top_level_definitions.append(to_node_info(self.file_uri, node))
         self.generic_visit(node)
 
     def visit_ClassDef(self, node):
-        self.top_level_definitions.append(
-            NodeInfo(
-                uri=self.file_uri,
-                node=node,
-            )
-        )
+        self.top_level_definitions.append(to_node_info(self.file_uri, node))
         self.generic_visit(node)
 
     def _get_span(self, node):
@@ -126,6 +176,56 @@ class TopLevelVisitor(ast.NodeVisitor):
         )
 
 
+class DefinitionCallsVisitor(TopLevelVisitor):
+    """Collects every definition like TopLevelVisitor, and in the same pass the calls made by each one.
+    Calls are attributed only to their innermost enclosing definition, unless innermost_only is False.
+    """
+
+    def __init__(self, uri, innermost_only: bool = True):
+        super().__init__(uri)
+        self.innermost_only = innermost_only
+        self.definition_calls: dict[tuple[str, int, int], set[VisitedNode]] = {}
+        self._enclosing: list[set[VisitedNode]] = []
+
+    def _visit_definition(self, node):
+        node_info = to_node_info(self.file_uri, node)
+        self.top_level_definitions.append(node_info)
+        calls = self.definition_calls.setdefault(definition_key(node_info), set())
+        self._enclosing.append(calls)
+        self.generic_visit(node)
+        self._enclosing.pop()
+
+    visit_FunctionDef = _visit_definition
+    visit_AsyncFunctionDef = _visit_definition
+    visit_ClassDef = _visit_definition
+
+    def visit_Call(self, node):
+        if self._enclosing:
+            call = call_to_visited_node(self.file_uri, node)
+            if call is not None:
+                if self.innermost_only:
+                    self._enclosing[-1].add(call)
+                else:
+                    for calls in self._enclosing:
+                        calls.add(call)
+        self.generic_visit(node)
+
+
+def find_definitions_and_calls(
+    file_path, innermost_only: bool = True
+) -> tuple[list[NodeInfo], dict[tuple[str, int, int], set[VisitedNode]]]:
+    """Single pass over the file returning every definition and a map of definition_key -> outgoing calls."""
+    with open(file_path, "r") as file:
+        content = file.read()
+
+    tree = ast.parse(content)
+    visitor = DefinitionCallsVisitor(
+        uri="file://" + file_path, innermost_only=innermost_only
+    )
+    visitor.visit(tree)
+    return visitor.top_level_definitions, visitor.definition_calls
+
+
 def find_top_level_definitions(file_path) -> list[NodeInfo]:
     with open(file_path, "r") as file:
         content = file.read()
@@ -136,6 +236,43 @@ def find_top_level_definitions(file_path) -> list[NodeInfo]:
     return visitor.top_level_definitions
 
 
+def find_enclosing_definitions(
+    definitions: list[NodeInfo], line_ranges: list[tuple[int, int]]
+) -> list[NodeInfo]:
+    """The innermost of definitions enclosing each line of line_ranges (1-indexed, inclusive), in order of appearance.
+    One sweep over both sorted lists, keeping a stack of the definitions open at the current line."""
+    # outer definitions first when two start on the same line
+    definitions = sorted(definitions, key=lambda n: (n.start_line, -n.end_line))
+    enclosing: dict[tuple[str, int, int], NodeInfo] = {}
+    open_definitions: list[NodeInfo] = []
+    next_definition = 0
+    last_line = 0
+    for start, end in sorted(line_ranges):
+        # overlapping ranges are swept once
+        for line in range(max(start, last_line + 1), end + 1):
+            while (
+                next_definition < len(definitions)
+                and definitions[next_definition].start_line <= line
+            ):
+                open_definitions.append(definitions[next_definition])
+                next_definition += 1
+            # definitions are nested, so the open ones form a chain and the latest started is the innermost
+            while open_definitions and open_definitions[-1].end_line < line:
+                open_definitions.pop()
+            if open_definitions:
+                innermost = open_definitions[-1]
+                enclosing[definition_key(innermost)] = innermost
+        last_line = max(last_line, end)
+    return sorted(enclosing.values(), key=lambda n: n.line)
+
+
+def find_definitions_in_line_ranges(
+    file_path: str, line_ranges: list[tuple[int, int]]
+) -> list[NodeInfo]:
+    """Map changed line ranges (1-indexed, inclusive) to the innermost function or class definitions enclosing them."""
+    return find_enclosing_definitions(find_top_level_definitions(file_path), line_ranges)
+
+
 def find_function_or_class_range(file_uri: str, object_name: str) -> Optional[NodeInfo]:
     """works for functions and classes"""
     with open(file_uri) as f:
@@ -148,24 +285,15 @@ def find_function_or_class_range(file_uri: str, object_name: str) -> Optional[No
 
         def visit_FunctionDef(self, node):
             if node.name == self.object_name:
-                self.object_details = NodeInfo(
-                    uri=file_uri,
-                    node=node,
-                )
+                self.object_details = to_node_info(file_uri, node)
 
         def visit_AsyncFunctionDef(self, node):
             if node.name == self.object_name:
-                self.object_details = NodeInfo(
-                    uri=file_uri,
-                    node=node,
-                )
+                self.object_details = to_node_info(file_uri, node)
 
         def visit_ClassDef(self, node):
             if node.name == self.object_name:
-                self.object_details = NodeInfo(
-                    uri=file_uri,
-                    node=node,
-                )
+                self.object_details = to_node_info(file_uri, node)
 
         def _get_span(self, node):
             start_line = node.lineno
@@ -185,6 +313,34 @@ def find_function_or_class_range(file_uri: str, object_name: str) -> Optional[No
     return visitor.object_details
 
 
+def call_to_visited_node(uri: str, node: ast.Call) -> Optional[VisitedNode]:
+    """Return the position of the called name for a function/method call. Excludes builtins."""
+    if isinstance(node.func, ast.Name) and node.func.id not in get_builtin_functions():
+        # Direct function call like foo()
+        return VisitedNode(
+            uri=uri,
+            name=node.func.id,
+            line=node.lineno - 1,
+            character=node.col_offset + 1,
+        )
+    elif (
+        isinstance(node.func, ast.Attribute)
+        and node.func.attr not in get_builtin_methods()
+    ):
+        # Method call or namespaced function call like obj.method()
+        return VisitedNode(
+            uri=uri,
+            name=node.func.attr,
+            line=node.lineno - 1,
+            character=node.func.end_col_offset,
+        )
+    return None
+
+
+def definition_key(node_info: NodeInfo) -> tuple[str, int, int]:
+    return (node_info.uri, node_info.line, node_info.character)
+
+
 def find_all_method_and_function_calls(node_info: NodeInfo) -> set[VisitedNode]:
     """Given a file and function or class name, finds all the method and function calls inside that function"""
     calls: set[VisitedNode] = set()
@@ -192,36 +348,14 @@ def find_all_method_and_function_calls(node_info: NodeInfo) -> set[VisitedNode]:
     for fnode in ast.walk(tree):
         if (
             isinstance(fnode, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))
-            and fnode.name == node_info.node.name
+            and fnode.lineno == node_info.line
+            and fnode.name == node_info.name
         ):
             for node in ast.walk(fnode):
                 if isinstance(node, ast.Call):
-                    # For function/method calls, get the function/method name. Exclude builtins.
-                    if isinstance(node.func, ast.Name) and node.func.id not in dir(
-                        builtins
-                    ):
-                        # Direct function call like foo()
-                        calls.add(
-                            VisitedNode(
-                                uri=node_info.uri,
-                                name=node.func.id,
-                                line=node.lineno - 1,
-                                character=node.col_offset + 1,
-                            ),
-                        )
-                    elif (
-                        isinstance(node.func, ast.Attribute)
-                        and node.func.attr not in BUILTIN_METHODS
-                    ):
-                        # Method call or namespaced function call like obj.method()
-                        calls.add(
-                            VisitedNode(
-                                uri=node_info.uri,
-                                name=node.func.attr,
-                                line=node.lineno - 1,
-                                character=node.func.end_col_offset,
-                            )
-                        )
+                    call = call_to_visited_node(node_info.uri, node)
+                    if call is not None:
+                        calls.add(call)
             break
     return calls
 
@@ -234,6 +368,28 @@ def filter_out_builtins_from_locations(node_information: list[NodeInfo]):
     ]
 
 
+def find_imported_module_names(file_content: str, package: str) -> list[str]:
+    """Absolute dotted names of everything the file imports. For from-imports both the module and module.name are
+    returned, since the name may be a submodule. package is the importing file's package, to resolve relative imports.
+    """
+    names = []
+    for node in ast.walk(ast.parse(file_content)):
+        if isinstance(node, ast.Import):
+            names.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                parts = package.split(".") if package else []
+                base = parts[: len(parts) - (node.level - 1)]
+                module = ".".join(base + ([node.module] if node.module else []))
+            else:
+                module = node.module
+            if module:
+                names.append(module)
+            prefix = module + "." if module else ""
+            names.extend(prefix + alias.name for alias in node.names)
+    return names
+
+
 #####################################
 ######### UNUSED FUNCTIONS ##########
 #####################################
@@ -251,6 +407,8 @@ def find_top_level_imports_ast(file_content) -> list[ImportInfo]:
 
 
 def get_module_file_path(module_name):
+    import importlib.util
+
     spec = importlib.util.find_spec(module_name)
     if spec is not None:
         return spec.origin
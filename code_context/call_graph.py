@@ -0,0 +1,265 @@
+import json
+import os
+import sys
+from array import array
+from collections import defaultdict
+from typing import Optional
+
+from code_context.utils import BREAK_LINE, find_uncontained_spans
+
+MAGIC = b"CCG3"
+# (attribute, typecode). Ids, lines and offsets all fit in 32 bits. The item size of "I" is platform dependent, so
+# save records it and load refuses files written with a different one.
+ARRAYS = [
+    ("span_file", "I"),
+    ("span_start", "I"),
+    ("span_end", "I"),
+    ("offsets", "I"),
+    ("targets", "I"),
+    ("file_offsets", "I"),
+    ("file_nodes", "I"),
+]
+
+
+def get_file_stat(uri: str) -> Optional[tuple[int, int]]:
+    """(mtime in ns, size) of the file at uri, None if it cannot be read."""
+    try:
+        stat = os.stat(uri.removeprefix("file://"))
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class CallGraph:
+    """Call graph over integer node ids in CSR form. The callees of node i are targets[offsets[i] : offsets[i + 1]].
+    Each node is the span (file id, start line, end line) of a function or class, 1-indexed and inclusive of decorators.
+    The nodes of file f, in ascending id order, are file_nodes[file_offsets[f] : file_offsets[f + 1]].
+    file_stats holds the (mtime in ns, size) of each file when the graph was built, to tell when its spans are stale.
+    """
+
+    def __init__(
+        self,
+        files: list[str],
+        names: list[str],
+        span_file: array,
+        span_start: array,
+        span_end: array,
+        offsets: array,
+        targets: array,
+        file_offsets: array,
+        file_nodes: array,
+        file_stats: list[Optional[tuple[int, int]]],
+    ):
+        self.files = files
+        self.names = names
+        self.span_file = span_file
+        self.span_start = span_start
+        self.span_end = span_end
+        self.offsets = offsets
+        self.targets = targets
+        self.file_offsets = file_offsets
+        self.file_nodes = file_nodes
+        self.file_stats = file_stats
+        self._file_ids = {uri: i for i, uri in enumerate(files)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def callees(self, node_id: int) -> array:
+        return self.targets[self.offsets[node_id] : self.offsets[node_id + 1]]
+
+    def span(self, node_id: int) -> tuple[str, int, int]:
+        return (
+            self.files[self.span_file[node_id]],
+            self.span_start[node_id],
+            self.span_end[node_id],
+        )
+
+    def find(self, uri: str, name: str) -> Optional[int]:
+        """Return the id of the first definition called name in uri."""
+        file_id = self._file_ids.get(uri)
+        if file_id is None:
+            return None
+        # only the nodes of the file are scanned, an index over every name would cost more to build than a query
+        names = self.names
+        for node_id in self.file_nodes[
+            self.file_offsets[file_id] : self.file_offsets[file_id + 1]
+        ]:
+            if names[node_id] == name:
+                return node_id
+        return None
+
+    def stale_files(self, node_ids: list[int]) -> list[str]:
+        """Files of node_ids changed or deleted since the graph was built, whose line spans can no longer be trusted."""
+        file_ids = sorted({self.span_file[n] for n in node_ids})
+        return [
+            self.files[f]
+            for f in file_ids
+            if self.file_stats[f] is not None
+            and get_file_stat(self.files[f]) != self.file_stats[f]
+        ]
+
+    def reachable(self, node_ids: list[int], depth: int) -> list[list[int]]:
+        """BFS from node_ids. Returns the nodes first reached at each level, level 0 being node_ids themselves."""
+        seen = bytearray(len(self.names))
+        offsets, targets = self.offsets, self.targets
+        frontier = []
+        for node_id in node_ids:
+            if not seen[node_id]:
+                seen[node_id] = 1
+                frontier.append(node_id)
+        levels = [frontier]
+        for _ in range(depth):
+            next_frontier = []
+            for node_id in frontier:
+                for target in targets[offsets[node_id] : offsets[node_id + 1]]:
+                    if not seen[target]:
+                        seen[target] = 1
+                        next_frontier.append(target)
+            if not next_frontier:
+                break
+            levels.append(next_frontier)
+            frontier = next_frontier
+        return levels
+
+    def save(self, path: str):
+        header = {
+            "files": self.files,
+            "names": self.names,
+            "file_stats": self.file_stats,
+            "byteorder": sys.byteorder,
+            "itemsizes": {name: getattr(self, name).itemsize for name, _ in ARRAYS},
+            "lengths": {name: len(getattr(self, name)) for name, _ in ARRAYS},
+        }
+        header_bytes = json.dumps(header).encode()
+        with open(path, "wb") as f:
+            f.write(MAGIC)
+            f.write(len(header_bytes).to_bytes(8, "little"))
+            f.write(header_bytes)
+            for name, _ in ARRAYS:
+                getattr(self, name).tofile(f)
+
+    @classmethod
+    def load(cls, path: str) -> "CallGraph":
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a call graph file")
+            header_length = int.from_bytes(f.read(8), "little")
+            header = json.loads(f.read(header_length))
+            arrays = {}
+            for name, typecode in ARRAYS:
+                values = array(typecode)
+                if header["itemsizes"][name] != values.itemsize:
+                    raise ValueError(
+                        f"{path} stores {name} in {header['itemsizes'][name]} byte items,"
+                        f" this platform uses {values.itemsize}. Rebuild it with the index command."
+                    )
+                values.fromfile(f, header["lengths"][name])
+                if header["byteorder"] != sys.byteorder:
+                    values.byteswap()
+                arrays[name] = values
+        file_stats = [tuple(stat) if stat else None for stat in header["file_stats"]]
+        return cls(header["files"], header["names"], file_stats=file_stats, **arrays)
+
+
+class CallGraphBuilder:
+    """Accumulates nodes and edges, then packs them into a CallGraph."""
+
+    def __init__(self):
+        self.files: list[str] = []
+        self.names: list[str] = []
+        self.span_file = array("I")
+        self.span_start = array("I")
+        self.span_end = array("I")
+        self._file_ids: dict[str, int] = {}
+        self._node_ids: dict[tuple[int, int], int] = {}
+        self._edges: defaultdict[int, set[int]] = defaultdict(set)
+
+    def add_node(self, uri: str, name: str, start_line: int, end_line: int) -> int:
+        """Returns the id of the node, adding it if the span is new."""
+        file_id = self._file_ids.get(uri)
+        if file_id is None:
+            file_id = self._file_ids[uri] = len(self.files)
+            self.files.append(uri)
+        key = (file_id, start_line)
+        node_id = self._node_ids.get(key)
+        if node_id is None:
+            node_id = self._node_ids[key] = len(self.names)
+            self.names.append(name)
+            self.span_file.append(file_id)
+            self.span_start.append(start_line)
+            self.span_end.append(end_line)
+        return node_id
+
+    def add_edge(self, caller: int, callee: int):
+        if caller != callee:
+            self._edges[caller].add(callee)
+
+    def build(self) -> CallGraph:
+        offsets = array("I", [0])
+        targets = array("I")
+        for node_id in range(len(self.names)):
+            targets.extend(sorted(self._edges.get(node_id, ())))
+            offsets.append(len(targets))
+        nodes_by_file: list[list[int]] = [[] for _ in self.files]
+        for node_id, file_id in enumerate(self.span_file):
+            nodes_by_file[file_id].append(node_id)
+        file_offsets = array("I", [0])
+        file_nodes = array("I")
+        for nodes in nodes_by_file:
+            file_nodes.extend(nodes)
+            file_offsets.append(len(file_nodes))
+        return CallGraph(
+            list(self.files),
+            list(self.names),
+            array("I", self.span_file),
+            array("I", self.span_start),
+            array("I", self.span_end),
+            offsets,
+            targets,
+            file_offsets,
+            file_nodes,
+            [get_file_stat(uri) for uri in self.files],
+        )
+
+
+def get_graph_code_context(graph: CallGraph, node_id: int, depth: int) -> list[str]:
+    """Same output as get_depth_n_code_context, read from the graph instead of the language server."""
+    levels = graph.reachable([node_id], depth)
+    # children before parents, the target at the bottom, each depth ordered by (uri, line) as in get_depth_n_code_context
+    node_ids = [
+        n for level in reversed(levels) for n in sorted(level, key=graph.span)
+    ]
+    kept = find_uncontained_spans([graph.span(n) for n in node_ids])
+    node_ids = [node_ids[i] for i in kept]
+    file_lines: dict[int, list[str]] = {}
+    code_context = []
+    for n in node_ids:
+        file_id = graph.span_file[n]
+        if file_id not in file_lines:
+            with open(graph.files[file_id].replace("file://", "")) as f:
+                file_lines[file_id] = f.read().splitlines()
+        uri, start_line, end_line = graph.span(n)
+        code_snippet = "\n".join(file_lines[file_id][start_line - 1 : end_line])
+        code_context.append(uri + "\n" + code_snippet + BREAK_LINE)
+    return code_context
+
+
+def query_call_graph(graph_path: str, filename: str, function_or_class_name: str, depth: int):
+    graph = CallGraph.load(graph_path)
+    node_id = graph.find("file://" + os.path.abspath(filename), function_or_class_name)
+    if node_id is None:
+        print("Function or class not found in the call graph.")
+        sys.exit(1)
+    # printing spans of edited files would silently show the wrong lines
+    levels = graph.reachable([node_id], depth)
+    stale = graph.stale_files([n for level in levels for n in level])
+    if stale:
+        print(
+            "The call graph is out of date for "
+            + ", ".join(stale)
+            + ". Rebuild it with the index command.",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+    print("\n\n".join(get_graph_code_context(graph, node_id, depth)))
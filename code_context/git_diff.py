@@ -0,0 +1,155 @@
+from functools import lru_cache
+import os
+import re
+import subprocess
+from typing import Iterable, Optional
+
+HUNK_HEADER = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+
+
+def get_repo_root() -> str:
+    return subprocess.run(
+        ["git", "rev-parse", "--show-toplevel"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.strip()
+
+
+def parse_diff_line_ranges(diff_output: str) -> dict[str, list[tuple[int, int]]]:
+    """Parse a zero context unified diff into {file_path: [(start_line, end_line)]}. Lines are 1-indexed and inclusive, referring to the new version of the file."""
+    changed: dict[str, list[tuple[int, int]]] = {}
+    current_file = None
+    for line in diff_output.splitlines():
+        if line.startswith("+++ "):
+            path = line[4:].strip()
+            # deleted files have no new version to find definitions in
+            current_file = None if path == "/dev/null" else path.removeprefix("b/")
+        elif line.startswith("@@") and current_file is not None:
+            match = HUNK_HEADER.match(line)
+            if match is None:
+                continue
+            start = int(match.group(1))
+            count = int(match.group(2)) if match.group(2) is not None else 1
+            if count == 0:
+                # pure deletion, attribute it to the line preceding the removed block
+                start = max(start, 1)
+                end = start
+            else:
+                end = start + count - 1
+            changed.setdefault(current_file, []).append((start, end))
+    return changed
+
+
+def get_untracked_python_files(repo_root: str) -> list[str]:
+    """Paths, relative to repo_root, of the python files git does not track and does not ignore."""
+    return subprocess.run(
+        ["git", "ls-files", "--others", "--exclude-standard", "--", "*.py"],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=repo_root,
+    ).stdout.splitlines()
+
+
+def get_changed_line_ranges(rev: Optional[str] = None) -> dict[str, list[tuple[int, int]]]:
+    """Return the changed line ranges of every python file in the diff against rev (HEAD by default), keyed by absolute path.
+    git diff leaves out untracked files, they are new in full and so count as changed from their first line to their last."""
+    repo_root = get_repo_root()
+    diff_output = subprocess.run(
+        ["git", "diff", "--unified=0", "--no-color", rev or "HEAD", "--", "*.py"],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=repo_root,
+    ).stdout
+    changed = {
+        os.path.join(repo_root, path): ranges
+        for path, ranges in parse_diff_line_ranges(diff_output).items()
+        if os.path.exists(os.path.join(repo_root, path))
+    }
+    for path in get_untracked_python_files(repo_root):
+        path = os.path.join(repo_root, path)
+        with open(path) as f:
+            line_count = len(f.read().splitlines())
+        if line_count:
+            changed[path] = [(1, line_count)]
+    return changed
+
+
+@lru_cache(maxsize=None)
+def find_repo_root(directory: str) -> Optional[str]:
+    result = subprocess.run(
+        ["git", "-C", directory, "rev-parse", "--show-toplevel"],
+        capture_output=True,
+        text=True,
+    )
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+@lru_cache(maxsize=None)
+def get_uncommitted_files(repo_root: str) -> frozenset[str]:
+    """Absolute paths of the files that differ from HEAD, including untracked ones."""
+    # -z, so that paths are not quoted
+    status = subprocess.run(
+        ["git", "status", "--porcelain", "-z", "--no-renames", "--untracked-files=all"],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=repo_root,
+    ).stdout
+    return frozenset(
+        os.path.join(repo_root, entry[3:]) for entry in status.split("\0") if entry
+    )
+
+
+def get_file_stabilities(paths: Iterable[str]) -> dict[str, tuple[bool, float]]:
+    """{path: (is_committed, last_change_time)} of absolute file paths. Committed files changed at their last commit,
+    uncommitted ones at their modification time. Files outside a git repo, e.g. installed libraries, count as committed.
+    Takes a single git log per repository, however many files are asked about."""
+    stabilities: dict[str, tuple[bool, float]] = {}
+    committed_by_repo: dict[str, list[str]] = {}
+    for path in paths:
+        repo_root = find_repo_root(os.path.dirname(path))
+        if repo_root is None:
+            stabilities[path] = (True, os.path.getmtime(path))
+        elif path in get_uncommitted_files(repo_root):
+            stabilities[path] = (False, os.path.getmtime(path))
+        else:
+            committed_by_repo.setdefault(repo_root, []).append(path)
+    for repo_root, repo_paths in committed_by_repo.items():
+        last_commits = get_last_commit_times(repo_root, repo_paths)
+        for path in repo_paths:
+            last_commit = last_commits.get(path)
+            stabilities[path] = (
+                True,
+                last_commit if last_commit is not None else os.path.getmtime(path),
+            )
+    return stabilities
+
+
+def get_last_commit_times(repo_root: str, paths: list[str]) -> dict[str, float]:
+    """{path: commit time} of the last commit touching each of paths, from one git log over all of them. The log is
+    read as it is written, and git is stopped as soon as every path has been seen, rather than walking all history."""
+    wanted = {os.path.relpath(path, repo_root): path for path in paths}
+    last_commits: dict[str, float] = {}
+    commit_time = None
+    # newest first, each commit a NUL prefixed timestamp line followed by the files it touched
+    with subprocess.Popen(
+        ["git", "-c", "core.quotePath=false", "log", "--format=%x00%ct", "--name-only"]
+        + ["--no-renames", "--", *wanted],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        cwd=repo_root,
+    ) as git_log:
+        for line in git_log.stdout:
+            line = line.rstrip("\n")
+            if line.startswith("\0"):
+                commit_time = float(line[1:])
+            elif line in wanted and wanted[line] not in last_commits:
+                last_commits[wanted[line]] = commit_time
+                if len(last_commits) == len(wanted):
+                    break
+        git_log.terminate()
+    return last_commits
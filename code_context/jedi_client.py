@@ -1,11 +1,9 @@
 import asyncio
 from contextlib import asynccontextmanager
 import json
-import subprocess
-import sys
 from typing import Optional
-import websockets
 import os
+import time
 
 
 class LanguageServerClient:
@@ -18,7 +16,13 @@ class LanguageServerClient:
         )
         print(f"Running jedi client in {self.root_dir}")
 
-    async def initialize(self):
+    async def initialize(self, warmup_modules: int = 0):
+        """Start the server and initialize it on root_dir. With warmup_modules > 0, also warm jedi's caches for the
+        most imported modules of the project before returning, so that the first queries run at steady state speed.
+        """
+        import subprocess
+        import websockets
+
         self.jedi_server_process = subprocess.Popen(
             ["jedi-language-server", "--ws"],
         )
@@ -38,7 +42,48 @@ class LanguageServerClient:
                 },
             }
             await websocket.send(json.dumps(init_message))
-            return json.loads(await websocket.recv())
+            init_response = json.loads(await websocket.recv())
+        if warmup_modules > 0:
+            await self.warm_up(warmup_modules)
+        return init_response
+
+    async def warm_up(
+        self,
+        num_modules: int,
+        max_concurrent: int = 8,
+        requests_per_second: float = 50.0,
+    ):
+        """Send documentSymbol for the num_modules most imported project modules, with at most max_concurrent requests
+        in flight and no more than requests_per_second started."""
+        from code_context.lsp_client import LSPWebSocketClient
+
+        filenames = find_most_imported_files(self.root_dir, num_modules)
+        start = time.perf_counter()
+        client = LSPWebSocketClient(self.uri)
+        await client.connect()
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(max_concurrent)
+        interval = 1 / requests_per_second
+        next_start = loop.time()
+
+        async def warm_up_file(filename):
+            nonlocal next_start
+            async with slots:
+                delay = max(0.0, next_start - loop.time())
+                next_start = loop.time() + delay + interval
+                await asyncio.sleep(delay)
+                try:
+                    await client.get_document_symbol(filename)
+                except Exception as e:
+                    print(f"Warm up of {filename} failed: {e}")
+
+        try:
+            await asyncio.gather(*(warm_up_file(f) for f in filenames))
+        finally:
+            await client.close()
+        print(
+            f"Warmed up {len(filenames)} modules in {time.perf_counter() - start:.1f}s"
+        )
 
     async def close(self):
         # Terminate the process
@@ -48,6 +93,34 @@ class LanguageServerClient:
         self.jedi_server_process.wait()
 
 
+def find_most_imported_files(root_dir: str, limit: int) -> list[str]:
+    """The limit python files under root_dir that are imported by the most other files of the project."""
+    from collections import Counter
+
+    from code_context.ast_parsing import find_imported_module_names
+    from code_context.utils import find_python_files
+
+    module_files = {}
+    for filename in find_python_files(root_dir):
+        module = os.path.splitext(os.path.relpath(filename, root_dir))[0]
+        module = module.replace(os.sep, ".").removesuffix(".__init__")
+        module_files[module] = filename
+
+    import_counts = Counter()
+    for module, filename in module_files.items():
+        is_package = filename.endswith("__init__.py")
+        package = module if is_package else module.rpartition(".")[0]
+        try:
+            with open(filename) as f:
+                imported = find_imported_module_names(f.read(), package)
+        except (SyntaxError, UnicodeDecodeError):
+            continue
+        import_counts.update(
+            {module_files[name] for name in imported if name in module_files}
+        )
+    return [filename for filename, _ in import_counts.most_common(limit)]
+
+
 # language server constructor
 @asynccontextmanager
 async def lsp_server():
@@ -59,10 +132,11 @@ async def lsp_server():
         await lsp.close()
 
 
-async def run_jedi(root_dir):
+async def run_jedi(root_dir, warmup_modules: int = 0):
     lsp = LanguageServerClient(root_dir)
     try:
-        await lsp.initialize()
+        await lsp.initialize(warmup_modules)
+        print(f"Jedi server ready on {lsp.uri}")
         # Create an event that will be set when the program should terminate.
         stop_event = asyncio.Event()
 
@@ -1,8 +1,12 @@
-import ast
+from abc import ABC, abstractmethod
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager, suppress
+from functools import lru_cache
 import os
 import sys
+import time
 from typing import Optional
-import websockets
 import json
 import uuid
 from code_context.response_types import (
@@ -27,30 +31,75 @@ from code_context.ast_parsing import (
     find_all_method_and_function_calls,
     find_function_or_class_range,
     filter_out_builtins_from_locations,
-    find_node_at_position,
-    find_top_level_definitions,
+    find_definition_spans,
+    span_to_node_info,
+    find_enclosing_definitions,
+    find_definitions_and_calls,
+    definition_key,
+)
+from code_context.utils import (
+    read_file_uri,
+    find_python_files,
+    find_uncontained_spans,
+    EnhancedJSONEncoder,
+    BREAK_LINE,
 )
-from code_context.utils import read_file_uri, EnhancedJSONEncoder
 
-BREAK_LINE = "\n------------------------------------------------"  # two tokens
 
+class LSPClient(ABC):
+    """Sends LSP requests over a transport. Subclasses implement connect, send_message, receive_message and close.
+    Requests can be awaited concurrently, a reader task routes each response to its request by id.
+    Requests taking longer than request_timeout seconds are cancelled and raise asyncio.TimeoutError."""
 
-class LSPWebSocketClient:
-    def __init__(self, uri):
-        self.uri = uri
-        self.connection = None
+    def __init__(self, max_concurrent_requests: int = 32):
+        self.request_timeout: Optional[float] = None
+        self._pending: dict[str, asyncio.Future] = {}
+        self._reader_task: Optional[asyncio.Task] = None
+        self._request_slots = asyncio.Semaphore(max_concurrent_requests)
 
     def _generate_unique_id(self):
         return str(uuid.uuid4())
 
+    @abstractmethod
     async def connect(self):
-        self.connection = await websockets.connect(self.uri)
+        pass
 
+    @abstractmethod
     async def send_message(self, message):
-        await self.connection.send(json.dumps(message, cls=EnhancedJSONEncoder))
+        pass
 
+    @abstractmethod
     async def receive_message(self):
-        return json.loads(await self.connection.recv())
+        pass
+
+    @abstractmethod
+    async def close(self):
+        pass
+
+    async def _read_responses(self):
+        try:
+            while True:
+                response = await self.receive_message()
+                if "method" not in response:
+                    future = self._pending.pop(response.get("id"), None)
+                    if future is not None and not future.done():
+                        future.set_result(response)
+                elif "id" in response:
+                    # the server is asking the client something, none of which we support
+                    await self.send_message(
+                        {"jsonrpc": "2.0", "id": response["id"], "result": None}
+                    )
+                # otherwise a notification such as window/logMessage, skip it
+        except Exception as e:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError(f"LSP connection lost: {e}"))
+            self._pending.clear()
+
+    async def _stop_reading(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
 
     async def send_request(self, method: str, params: dict, request_id=None):
         if request_id is None:
@@ -61,11 +110,24 @@ class LSPWebSocketClient:
             "method": method,
             "params": params,
         }
-        await self.send_message(message)
-        return await self.receive_message()
+        if self._reader_task is None:
+            self._reader_task = asyncio.create_task(self._read_responses())
+        async with self._request_slots:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[request_id] = future
+            try:
+                await self.send_message(message)
+                return await asyncio.wait_for(future, self.request_timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                # tell the server to stop working on it
+                with suppress(Exception):
+                    await self.send_notification("$/cancelRequest", {"id": request_id})
+                raise
+            finally:
+                self._pending.pop(request_id, None)
 
-    async def close(self):
-        await self.connection.close()
+    async def send_notification(self, method: str, params: dict):
+        await self.send_message({"jsonrpc": "2.0", "method": method, "params": params})
 
     async def go_to_declaration(self, text_document: TextDocument, position: Position):
         response = await self.send_request(
@@ -132,113 +194,529 @@ class LSPWebSocketClient:
         return response
 
 
+class LSPWebSocketClient(LSPClient):
+    """Connects to a shared jedi-language-server started by start-jedi."""
+
+    def __init__(self, uri):
+        super().__init__()
+        self.uri = uri
+        self.connection = None
+
+    async def connect(self):
+        import websockets
+
+        self.connection = await websockets.connect(self.uri)
+
+    async def send_message(self, message):
+        await self.connection.send(json.dumps(message, cls=EnhancedJSONEncoder))
+
+    async def receive_message(self):
+        return json.loads(await self.connection.recv())
+
+    async def close(self):
+        await self._stop_reading()
+        # nothing to close if connect failed
+        if self.connection is not None:
+            await self.connection.close()
+
+
+class LSPStdioClient(LSPClient):
+    """Runs a private jedi-language-server as a subprocess and talks to it over Content-Length framed pipes.
+    No port is needed, so any number of clients can run on the same host."""
+
+    def __init__(self, root_dir: Optional[str] = None, command=("jedi-language-server",)):
+        super().__init__()
+        self.root_dir = os.path.abspath(root_dir or os.getcwd())
+        self.command = command
+        self.process = None
+
+    async def connect(self):
+        self.process = await asyncio.create_subprocess_exec(
+            *self.command,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+        )
+        await self.send_request(
+            "initialize",
+            {
+                "processId": os.getpid(),
+                "capabilities": {},
+                "workspaceFolders": None,
+                "rootUri": f"file://{self.root_dir}",
+                "initializationOptions": {},
+            },
+        )
+        await self.send_notification("initialized", {})
+
+    async def send_message(self, message):
+        body = json.dumps(message, cls=EnhancedJSONEncoder).encode()
+        self.process.stdin.write(b"Content-Length: %d\r\n\r\n" % len(body) + body)
+        await self.process.stdin.drain()
+
+    async def receive_message(self):
+        content_length = None
+        while True:
+            header = await self.process.stdout.readline()
+            if not header:
+                raise ConnectionError("jedi-language-server exited")
+            header = header.strip()
+            if not header:
+                break
+            name, _, value = header.decode().partition(":")
+            if name.lower() == "content-length":
+                content_length = int(value)
+        return json.loads(await self.process.stdout.readexactly(content_length))
+
+    async def close(self):
+        try:
+            # the server may have exited already, or never been started if connect failed
+            if self.process is None or self.process.returncode is not None:
+                return
+            try:
+                await asyncio.wait_for(self.send_request("shutdown", None), timeout=1)
+                await self.send_notification("exit", None)
+                await asyncio.wait_for(self.process.wait(), timeout=1)
+            except (asyncio.TimeoutError, ConnectionError):
+                self.process.kill()
+                await self.process.wait()
+        finally:
+            await self._stop_reading()
+
+
+def create_client(
+    transport: str = "ws", uri: Optional[str] = None, root_dir: Optional[str] = None
+) -> LSPClient:
+    if transport == "stdio":
+        return LSPStdioClient(root_dir)
+    return LSPWebSocketClient(uri or URI)
+
+
+@asynccontextmanager
+async def connected_client(
+    transport: str = "ws", uri: Optional[str] = None, root_dir: Optional[str] = None
+):
+    client = create_client(transport, uri, root_dir)
+    try:
+        await client.connect()
+        yield client
+    finally:
+        await client.close()
+
+
+@lru_cache(maxsize=None)
+def get_parse_pool() -> ProcessPoolExecutor:
+    """Worker processes for parsing. ast.parse holds the GIL throughout, so in a thread it would still stall the event
+    loop for the length of the parse."""
+    return ProcessPoolExecutor()
+
+
+class FileParser:
+    """Extracts the definition spans of target files in worker processes as soon as their uris are known, so that
+    parsing overlaps with the LSP requests still in flight and never blocks the event loop. Each file is parsed once per
+    FileParser, and only its spans are kept, never the tree."""
+
+    def __init__(self):
+        self._spans: dict[str, asyncio.Future] = {}
+
+    def prefetch(self, file_uri: str) -> asyncio.Future:
+        if file_uri not in self._spans:
+            self._spans[file_uri] = asyncio.get_running_loop().run_in_executor(
+                get_parse_pool(), find_definition_spans, file_uri
+            )
+        return self._spans[file_uri]
+
+    async def find_definition(self, file_uri: str, lsp_line_no: int) -> Optional[NodeInfo]:
+        """The definition on the line the language server pointed at. Anything else there, e.g. an assignment creating
+        an alias, is not followed."""
+        line = lsp_line_no + 1
+        span = (await self.prefetch(file_uri)).get(line)
+        if span is None:
+            return None
+        return span_to_node_info(file_uri, line, span)
+
+
+async def resolve_call(
+    client: LSPClient, call: VisitedNode, file_parser: Optional[FileParser] = None
+) -> list[NodeInfo]:
+    """Return the function and class definitions the call site resolves to."""
+    if file_parser is None:
+        file_parser = FileParser()
+    definition = await client.get_type_definition(
+        TextDocument(uri=call.uri),
+        Position(line=call.line, character=call.character),
+    )
+    if not definition.result:
+        return []
+    for obj_def in definition.result:
+        file_parser.prefetch(obj_def.uri)
+    definitions = await asyncio.gather(
+        *(
+            file_parser.find_definition(obj_def.uri, obj_def.range.start.line)
+            for obj_def in definition.result
+        )
+    )
+    return [d for d in definitions if d is not None]
+
+
+class Deadline:
+    """Overall time budget of a traversal, None for no budget. Call sites that could not be resolved in time, or whose
+    request timed out, are recorded in skipped_calls, definitions whose calls were never looked up in unexpanded."""
+
+    def __init__(self, seconds: Optional[float]):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds if seconds is not None else None
+        self.skipped_calls: list[VisitedNode] = []
+        self.unexpanded: list[NodeInfo] = []
+
+    def remaining(self) -> Optional[float]:
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and self.remaining() <= 0
+
+    def note(self) -> Optional[str]:
+        """Says what was left out of the context, if anything."""
+        if not self.skipped_calls and not self.unexpanded:
+            return None
+        if self.expired:
+            lines = [f"# Deadline of {self.seconds}s reached, this context is partial."]
+        else:
+            lines = ["# Some requests timed out, this context is partial."]
+        lines.extend(
+            f"# Skipped call site: {call.uri}:{call.line + 1} {call.name}"
+            for call in self.skipped_calls
+        )
+        lines.extend(
+            f"# Calls not followed: {n.uri}:{n.line} {n.name}" for n in self.unexpanded
+        )
+        return "\n".join(lines)
+
+
+async def resolve_calls_within_deadline(
+    client: LSPClient,
+    calls: list[VisitedNode],
+    file_parser: FileParser,
+    deadline: Optional[Deadline] = None,
+) -> list[list[NodeInfo]]:
+    """resolve_call for every call concurrently. Once the deadline expires the outstanding requests are cancelled, and
+    those calls, along with any whose request timed out, resolve to nothing and are recorded as skipped."""
+    if not calls:
+        return []
+    tasks = [
+        asyncio.create_task(resolve_call(client, call, file_parser)) for call in calls
+    ]
+    timeout = deadline.remaining() if deadline is not None else None
+    _, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    resolved = []
+    for call, task in zip(calls, tasks):
+        if deadline is not None and (
+            task.cancelled() or isinstance(task.exception(), asyncio.TimeoutError)
+        ):
+            deadline.skipped_calls.append(call)
+            resolved.append([])
+        else:
+            resolved.append(task.result())
+    return resolved
+
+
+async def get_calls(
+    node_info: NodeInfo,
+    definition_calls: Optional[dict[tuple[str, int, int], set[VisitedNode]]] = None,
+) -> set[VisitedNode]:
+    key = definition_key(node_info)
+    if definition_calls is not None and key in definition_calls:
+        return definition_calls[key]
+    return await asyncio.get_running_loop().run_in_executor(
+        get_parse_pool(), find_all_method_and_function_calls, node_info
+    )
+
+
 async def get_function_context(
-    client: LSPWebSocketClient,
+    client: LSPClient,
     function_or_class_names: list[NodeInfo],
     visited_nodes: set[VisitedNode],
+    definition_calls: Optional[dict[tuple[str, int, int], set[VisitedNode]]] = None,
+    deadline: Optional[Deadline] = None,
 ) -> list[NodeInfo]:
-    """Given a file and a function or class name, return all the function calls inside of that function or class. Filters for builtins and duplicates."""
+    """Given a file and a function or class name, return all the function calls inside of that function or class. Filters for builtins and duplicates.
+    definition_calls optionally holds precomputed calls per definition (see find_definitions_and_calls).
+    All call sites are resolved concurrently, within the deadline if one is given."""
     calls: set[VisitedNode] = set()
-    for node_info in function_or_class_names:
-        fcalls = find_all_method_and_function_calls(node_info)
+    for fcalls in await asyncio.gather(
+        *(get_calls(n, definition_calls) for n in function_or_class_names)
+    ):
         calls.update(fcalls)
     # look up all the call definitions and find the relevant nodes.
-    type_definitions: set[NodeInfo] = set()
-    for call in calls:
-        definition = await client.get_type_definition(
-            TextDocument(uri=call.uri),
-            Position(line=call.line, character=call.character),
-        )
-        if definition.result:
-            for obj_def in definition.result:
-                node = find_node_at_position(
-                    read_file_uri(obj_def.uri),
-                    obj_def.range.start.line,
-                    call.name,
-                )
-                if isinstance(node, ast.Assign):
-                    print("found assign")
-                    print(node.targets[0].id)
-                    print(node.value, type(node.value))
-                    node = None  # node.value
-
-                if node is not None:
-                    vnode = VisitedNode(
-                        name=node.name,
-                        line=node.lineno,
-                        character=node.col_offset,
-                        uri=obj_def.uri,
-                    )
-                    if vnode not in visited_nodes:
-                        type_definitions.add(NodeInfo(uri=obj_def.uri, node=node))
-                        visited_nodes.add(vnode)
+    # sorted, so that which of several calls to the same definition is recorded first does not vary between runs
+    resolved = await resolve_calls_within_deadline(
+        client,
+        sorted(calls, key=lambda c: (c.uri, c.line, c.character, c.name)),
+        FileParser(),
+        deadline,
+    )
+    type_definitions: list[NodeInfo] = []
+    for node_infos in resolved:
+        for node_info in node_infos:
+            vnode = VisitedNode(
+                name=node_info.name,
+                line=node_info.line,
+                character=node_info.character,
+                uri=node_info.uri,
+            )
+            if vnode not in visited_nodes:
+                type_definitions.append(node_info)
+                visited_nodes.add(vnode)
     filtered_type_definitions = filter_out_builtins_from_locations(type_definitions)
     return filtered_type_definitions
 
 
+def node_sort_key(node_info: NodeInfo) -> tuple[str, int, int]:
+    return (node_info.uri, node_info.line, node_info.character)
+
+
+def node_path(node_info: NodeInfo) -> str:
+    """Absolute path of the node's file. Targets given by path and definitions returned as file:// uris can be the same
+    file."""
+    return os.path.abspath(node_info.uri.removeprefix("file://"))
+
+
+def order_stable_first(
+    node_infos: list[NodeInfo], targets: list[NodeInfo]
+) -> tuple[list[NodeInfo], int]:
+    """Order the snippets from rarely to frequently changing files, the targets last, so that the start of the context
+    stays byte-identical across runs and across related targets. Returns the ordering and the length of the stable
+    prefix: the leading snippets from committed files other than the targets' files."""
+    from code_context.git_diff import get_file_stabilities
+
+    target_keys = {node_sort_key(n) for n in targets}
+    target_files = {node_path(n) for n in targets}
+    stability = get_file_stabilities({node_path(n) for n in node_infos})
+
+    def stability_key(node_info: NodeInfo):
+        is_committed, change_time = stability[node_path(node_info)]
+        is_target = node_sort_key(node_info) in target_keys
+        return (is_target, not is_committed, change_time, node_sort_key(node_info))
+
+    ordered = sorted(node_infos, key=stability_key)
+    stable_count = 0
+    for node_info in ordered:
+        path = node_path(node_info)
+        if path in target_files or not stability[path][0]:
+            break
+        stable_count += 1
+    return ordered, stable_count
+
+
 async def get_depth_n_code_context(
-    client: LSPWebSocketClient,
+    client: LSPClient,
     function_or_class_names: list[NodeInfo],
     depth: int,
+    definition_calls: Optional[dict[tuple[str, int, int], set[VisitedNode]]] = None,
+    deadline: Optional[Deadline] = None,
+    stable_first: bool = False,
 ):
     # record the target nodes as visited
     visited_nodes: set[VisitedNode] = {
-        VisitedNode(
-            name=n.node.name, uri=n.uri, line=n.node.lineno, character=n.node.col_offset
-        )
+        VisitedNode(name=n.name, uri=n.uri, line=n.line, character=n.character)
         for n in function_or_class_names
     }
-    # add target nodes to call list
-    function_calls: list[NodeInfo] = function_or_class_names
+    # the target nodes are depth 0
+    levels: list[list[NodeInfo]] = [list(function_or_class_names)]
     # Step 1: find all the calls inside the function(s).
-    inner_function_calls = await get_function_context(
-        client, function_or_class_names, visited_nodes
+    levels.append(
+        await get_function_context(
+            client, function_or_class_names, visited_nodes, definition_calls, deadline
+        )
     )
-    function_calls.extend(inner_function_calls)
     # Step 2: (Optional) recursively find all the sub-function calls.
+    # Only the nodes found at the previous depth are new, everything they call is resolved in one concurrent batch.
     for _ in range(depth - 1):
-        depth_n_function_calls = []
-        for node_info in function_calls:
-            inner_function_calls = await get_function_context(
+        frontier = levels[-1]
+        if not frontier:
+            break
+        if deadline is not None and deadline.expired:
+            deadline.unexpanded.extend(frontier)
+            break
+        levels.append(
+            await get_function_context(
                 client,
-                [node_info],
+                frontier,
                 visited_nodes,
+                definition_calls,
+                deadline,
             )
-            depth_n_function_calls.extend(inner_function_calls)
-        function_calls.extend(depth_n_function_calls)
-    # Reversing the the context in order to have the original source code at the bottom.
+        )
+    # Canonical order, so that the output is identical across runs: by depth, then (uri, line).
+    # The depths are reversed in order to have the original source code at the bottom.
     # This is better for GPT since it will see the code from child to parent.
-    function_calls.reverse()
+    function_calls = [
+        n for level in reversed(levels) for n in sorted(level, key=node_sort_key)
+    ]
     # Step 3: Given all the nodes and file paths, copy the relevant text.
+    # Drop duplicates, and snippets already printed as part of an enclosing class or function.
+    kept = find_uncontained_spans(
+        [(node_path(n), n.start_line, n.end_line) for n in function_calls]
+    )
+    function_calls = [function_calls[i] for i in kept]
+    if stable_first:
+        function_calls, stable_count = order_stable_first(function_calls, levels[0])
     code_context = []
     for node_info in function_calls:
-        code_snippet = extract_code_segment(
-            read_file_uri(node_info.uri), node_info.node
-        )
+        code_snippet = extract_code_segment(read_file_uri(node_info.uri), node_info)
         code_context.append(node_info.uri + "\n" + code_snippet + BREAK_LINE)
 
+    if stable_first:
+        report_stable_prefix(code_context, stable_count)
     return code_context
 
 
-async def get_file_context(client: LSPWebSocketClient, filename: str, depth: int):
-    # Step 1: Find all the functions and classes in the file.
-    top_level_definitions = find_top_level_definitions(filename)
+def report_stable_prefix(code_context: list[str], stable_count: int):
+    """Print to stderr how much of the output is the stable prefix, i.e. could hit a provider side prompt cache."""
+    # snippets are joined by two newlines
+    snippet_bytes = [len(snippet.encode()) + 2 for snippet in code_context]
+    total_bytes = max(sum(snippet_bytes) - 2, 0)
+    prefix_bytes = min(sum(snippet_bytes[:stable_count]), total_bytes)
+    print(
+        f"Stable prefix: {prefix_bytes} of {total_bytes} bytes"
+        f" ({stable_count} of {len(code_context)} snippets)",
+        file=sys.stderr,
+    )
+
+
+async def get_file_context(
+    client: LSPClient,
+    filename: str,
+    depth: int,
+    deadline: Optional[Deadline] = None,
+    stable_first: bool = False,
+):
+    # Step 1: Find all the functions and classes in the file, and the calls made by each, in one pass.
+    top_level_definitions, definition_calls = find_definitions_and_calls(filename)
     # Step 2: Iterate through all the functions and classes. Find external references.
-    return await get_depth_n_code_context(client, top_level_definitions, depth=depth)
+    return await get_depth_n_code_context(
+        client,
+        top_level_definitions,
+        depth=depth,
+        definition_calls=definition_calls,
+        deadline=deadline,
+        stable_first=stable_first,
+    )
+
+
+def find_changed_definitions(
+    rev: Optional[str],
+) -> tuple[list[NodeInfo], dict[tuple[str, int, int], set[VisitedNode]]]:
+    """The innermost definitions enclosing the lines changed in git diff rev, and the calls made by each of them.
+    Each changed file is parsed once. Files that do not parse, e.g. mid-edit, are skipped."""
+    from code_context.git_diff import get_changed_line_ranges
+
+    changed_definitions: list[NodeInfo] = []
+    definition_calls: dict[tuple[str, int, int], set[VisitedNode]] = {}
+    for filename, line_ranges in get_changed_line_ranges(rev).items():
+        try:
+            # calls of nested definitions included, as in find_all_method_and_function_calls
+            definitions, file_calls = find_definitions_and_calls(
+                filename, innermost_only=False
+            )
+        except (SyntaxError, UnicodeDecodeError):
+            print(f"Skipping {filename}, could not parse it.", file=sys.stderr)
+            continue
+        for node_info in find_enclosing_definitions(definitions, line_ranges):
+            changed_definitions.append(node_info)
+            key = definition_key(node_info)
+            definition_calls[key] = file_calls[key]
+    return changed_definitions, definition_calls
+
+
+def _add_graph_node(builder, node_info: NodeInfo) -> int:
+    return builder.add_node(
+        node_info.uri, node_info.name, node_info.start_line, node_info.end_line
+    )
+
+
+async def build_call_graph(client: LSPClient, filenames: list[str]):
+    """Resolve every call site in filenames once and pack the result into a CallGraph.
+    A definition's edges include the calls of its nested definitions, as in get_function_context."""
+    from code_context.call_graph import CallGraphBuilder
+
+    builder = CallGraphBuilder()
+    for filename in filenames:
+        try:
+            definitions, definition_calls = find_definitions_and_calls(
+                os.path.abspath(filename), innermost_only=False
+            )
+        except (SyntaxError, UnicodeDecodeError):
+            print(f"Skipping {filename}, could not parse it.", file=sys.stderr)
+            continue
+        # resolve each call site of the file once, concurrently
+        file_calls = {
+            (call.uri, call.line, call.character): call
+            for calls in definition_calls.values()
+            for call in calls
+        }
+        file_parser = FileParser()
+        resolved = dict(
+            zip(
+                file_calls,
+                await asyncio.gather(
+                    *(
+                        resolve_call(client, call, file_parser)
+                        for call in file_calls.values()
+                    )
+                ),
+            )
+        )
+        for node_info in definitions:
+            caller = _add_graph_node(builder, node_info)
+            for call in definition_calls[definition_key(node_info)]:
+                callees = resolved[(call.uri, call.line, call.character)]
+                for callee in filter_out_builtins_from_locations(callees):
+                    builder.add_edge(caller, _add_graph_node(builder, callee))
+    return builder.build()
 
 
 URI = "ws://0.0.0.0:2087"
 
 
-async def call_lsp(filename, function_or_class_name, depth):
-    try:
-        # Instantiate the lsp client
-        client = LSPWebSocketClient(URI)
-        await client.connect()
+def format_context(context: list[str], deadline: Optional[Deadline] = None) -> str:
+    output = "\n\n".join(context)
+    note = deadline.note() if deadline is not None else None
+    if note:
+        output += "\n\n" + note
+    return output
 
-        if not os.path.exists(filename):
-            print("File does not exist.")
-            sys.exit(1)
+
+def start_deadline(
+    client: LSPClient, deadline: Optional[float], request_timeout: Optional[float]
+) -> Optional[Deadline]:
+    client.request_timeout = request_timeout
+    if deadline is None and request_timeout is None:
+        return None
+    return Deadline(deadline)
+
+
+async def call_lsp(
+    filename,
+    function_or_class_name,
+    depth,
+    uri=URI,
+    transport="ws",
+    root_dir=None,
+    deadline=None,
+    request_timeout=None,
+    stable_first=False,
+):
+    if not os.path.exists(filename):
+        print("File does not exist.")
+        sys.exit(1)
+    async with connected_client(transport, uri, root_dir) as client:
+        traversal_deadline = start_deadline(client, deadline, request_timeout)
         if function_or_class_name:
             # Initial setup: Find function position, etc.
             node_info = find_function_or_class_range(filename, function_or_class_name)
@@ -246,11 +724,58 @@ async def call_lsp(filename, function_or_class_name, depth):
                 print("Function or class not found in the file.")
                 sys.exit(1)
 
-            context = await get_depth_n_code_context(client, [node_info], depth=depth)
+            context = await get_depth_n_code_context(
+                client,
+                [node_info],
+                depth=depth,
+                deadline=traversal_deadline,
+                stable_first=stable_first,
+            )
         else:
             # Get context for all the functions and classes in the file
-            context = await get_file_context(client, filename, depth=depth)
-        context = "\n\n".join(context)
-        print(context)
-    finally:
-        await client.close()
+            context = await get_file_context(
+                client,
+                filename,
+                depth=depth,
+                deadline=traversal_deadline,
+                stable_first=stable_first,
+            )
+        print(format_context(context, traversal_deadline))
+
+
+async def call_lsp_diff(
+    rev,
+    depth,
+    uri=URI,
+    transport="ws",
+    root_dir=None,
+    deadline=None,
+    request_timeout=None,
+    stable_first=False,
+):
+    # Step 1: Map the changed lines of every file in the diff to their enclosing functions and classes.
+    # Done before connecting, an empty diff needs no language server.
+    changed_definitions, definition_calls = find_changed_definitions(rev)
+    if not changed_definitions:
+        # nothing to add is a normal outcome for an editor or review hook, and keeps stdout empty for pipes
+        print("No changed functions or classes found.", file=sys.stderr)
+        return
+    async with connected_client(transport, uri, root_dir) as client:
+        traversal_deadline = start_deadline(client, deadline, request_timeout)
+        # Step 2: One traversal over all of them, sharing the visited set.
+        context = await get_depth_n_code_context(
+            client,
+            changed_definitions,
+            depth=depth,
+            definition_calls=definition_calls,
+            deadline=traversal_deadline,
+            stable_first=stable_first,
+        )
+        print(format_context(context, traversal_deadline))
+
+
+async def call_lsp_index(root_dir, graph_path, uri=URI, transport="ws"):
+    async with connected_client(transport, uri, root_dir) as client:
+        graph = await build_call_graph(client, find_python_files(root_dir))
+        graph.save(graph_path)
+        print(f"Saved call graph with {len(graph)} nodes to {graph_path}")
@@ -0,0 +1,142 @@
+import asyncio
+import json
+import os
+import random
+from typing import Optional
+
+import websockets
+
+RECORDING_MISS = -32603
+
+
+def request_key(method: str, params) -> str:
+    return method + " " + json.dumps(params, sort_keys=True)
+
+
+class LSPReplayServer:
+    """Websocket stand-in for jedi-language-server.
+
+    In replay mode every request is answered from a recording, keyed by method and params, after an injected delay of
+    latency +/- jitter seconds. In record mode requests are forwarded to upstream_uri, and the responses are saved to the
+    recording when the client disconnects.
+    """
+
+    def __init__(
+        self,
+        recording_path: str,
+        record: bool = False,
+        upstream_uri: Optional[str] = None,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        seed: int = 0,
+    ):
+        if record and upstream_uri is None:
+            raise ValueError("Recording needs an upstream language server uri.")
+        self.recording_path = recording_path
+        self.record = record
+        self.upstream_uri = upstream_uri
+        self.latency = latency
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+        self.responses: dict[str, dict] = {}
+        if os.path.exists(recording_path):
+            self.load()
+
+    def load(self):
+        with open(self.recording_path) as f:
+            for entry in json.load(f):
+                self.responses[request_key(entry["method"], entry["params"])] = entry[
+                    "response"
+                ]
+
+    def save(self):
+        entries = []
+        for key, response in self.responses.items():
+            method, params = key.split(" ", 1)
+            entries.append(
+                {"method": method, "params": json.loads(params), "response": response}
+            )
+        with open(self.recording_path, "w") as f:
+            json.dump(entries, f, indent=1)
+
+    def _delay(self) -> float:
+        return max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+
+    async def _replay(self, websocket, message: dict):
+        response = self.responses.get(
+            request_key(message["method"], message.get("params"))
+        )
+        if response is None:
+            response = {
+                "error": {
+                    "code": RECORDING_MISS,
+                    "message": f"No recorded response for {message['method']}",
+                }
+            }
+        await asyncio.sleep(self._delay())
+        await websocket.send(
+            json.dumps({"jsonrpc": "2.0", "id": message["id"], **response})
+        )
+
+    async def _forward(self, websocket, upstream, message: dict):
+        await upstream.send(json.dumps(message))
+        while True:
+            reply = json.loads(await upstream.recv())
+            # skip server notifications until the response to this request arrives
+            if reply.get("id") == message["id"] and "method" not in reply:
+                break
+        response = {k: v for k, v in reply.items() if k in ("result", "error")}
+        self.responses[request_key(message["method"], message.get("params"))] = response
+        await websocket.send(json.dumps(reply))
+
+    async def handler(self, websocket):
+        upstream = (
+            await websockets.connect(self.upstream_uri) if self.record else None
+        )
+        pending: set[asyncio.Task] = set()
+        try:
+            async for raw in websocket:
+                message = json.loads(raw)
+                if "id" not in message:
+                    # notifications get no response
+                    if upstream is not None:
+                        await upstream.send(raw)
+                    continue
+                if upstream is not None:
+                    await self._forward(websocket, upstream, message)
+                else:
+                    # answered concurrently, so that overlapping requests also overlap their latency
+                    task = asyncio.create_task(self._replay(websocket, message))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+        finally:
+            if upstream is not None:
+                await upstream.close()
+                # once per session, rewriting the recording after every response is quadratic
+                self.save()
+
+    async def serve(self, host: str, port: int):
+        async with websockets.serve(self.handler, host, port):
+            await asyncio.Future()
+
+
+async def run_replay_server(
+    recording_path: str,
+    record: bool,
+    upstream_uri: Optional[str],
+    port: int,
+    latency: float,
+    jitter: float,
+    seed: int,
+):
+    server = LSPReplayServer(
+        recording_path,
+        record=record,
+        upstream_uri=upstream_uri,
+        latency=latency,
+        jitter=jitter,
+        seed=seed,
+    )
+    mode = f"Recording from {upstream_uri}" if record else "Replaying"
+    print(f"{mode} on ws://localhost:{port} with {recording_path}")
+    await server.serve("0.0.0.0", port)
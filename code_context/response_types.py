@@ -7,11 +7,12 @@ class HashableBaseModel(BaseModel):
     """Base class for pydantic models that can be hashed and compared"""
 
     def __hash__(self):
-        return hash((self.__class__,) + tuple(self.model_fields.values()))
+        fields = type(self).model_fields
+        return hash((self.__class__,) + tuple(getattr(self, f) for f in fields))
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
-            for field in self.model_fields:  # type: ignore
+            for field in type(self).model_fields:
                 if getattr(self, field) != getattr(other, field):
                     return False
             return True
@@ -40,9 +41,29 @@ class VisitedNode(HashableBaseModel):
     name: str
 
 
+class ObjectTypes(Enum):
+    FUNCTION = "Function"
+    ASYNC_FUNCTION = "Async Function"
+    CLASS = "Class"
+
+
 class NodeInfo(HashableBaseModel):
-    node: Any
+    """Location of a function or class definition. Holds no AST, so the parsed tree can be freed once this is extracted.
+    line and character are the 1-indexed line and column of the def/class keyword, decorator_offset the number of lines
+    its decorators start above it."""
+
     uri: str
+    name: str
+    kind: ObjectTypes
+    line: int
+    character: int
+    end_line: int
+    decorator_offset: int = 0
+
+    @property
+    def start_line(self) -> int:
+        """First line of the definition including its decorators."""
+        return self.line - self.decorator_offset
 
 
 class ImportInfo(HashableBaseModel):
@@ -58,12 +79,6 @@ class CallInfo(HashableBaseModel):
     character: int
 
 
-class ObjectTypes(Enum):
-    FUNCTION = "Function"
-    ASYNC_FUNCTION = "Async Function"
-    CLASS = "Class"
-
-
 ##########################################
 ######### LSP CLIENT TYPES ###############
 ##########################################
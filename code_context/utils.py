@@ -1,7 +1,9 @@
 from enum import Enum
 from functools import lru_cache
 import json
-from pydantic import BaseModel
+import os
+
+BREAK_LINE = "\n------------------------------------------------"  # two tokens
 
 
 @lru_cache(maxsize=100)
@@ -12,10 +14,45 @@ def read_file_uri(file_uri: str) -> str:
     return file_content
 
 
+def find_python_files(root_dir: str) -> list[str]:
+    """All python files under root_dir, skipping hidden directories and virtualenvs."""
+    filenames = []
+    for dirpath, dirnames, files in os.walk(root_dir):
+        dirnames[:] = sorted(
+            d
+            for d in dirnames
+            if not d.startswith(".") and d not in ("venv", "__pycache__")
+        )
+        filenames.extend(
+            os.path.join(dirpath, f) for f in sorted(files) if f.endswith(".py")
+        )
+    return filenames
+
+
+def find_uncontained_spans(spans: list[tuple[str, int, int]]) -> list[int]:
+    """Given (uri, start_line, end_line) spans, return the indices of those not contained in another span, in order.
+    Of identical spans only the first is kept."""
+    order = sorted(
+        range(len(spans)), key=lambda i: (spans[i][0], spans[i][1], -spans[i][2])
+    )
+    kept = []
+    current_uri, max_end = None, 0
+    for i in order:
+        uri, _, end = spans[i]
+        if uri != current_uri:
+            current_uri, max_end = uri, 0
+        # every earlier span in the sweep starts at or before this one
+        if end > max_end:
+            kept.append(i)
+            max_end = end
+    return sorted(kept)
+
+
 class EnhancedJSONEncoder(json.JSONEncoder):
     def default(self, o):
         if isinstance(o, Enum):
             return o.value  # Convert Enum to its value
-        if isinstance(o, BaseModel):
+        if hasattr(o, "model_dump"):
+            # pydantic models. Checked by duck typing so that utils does not import pydantic.
             return o.model_dump(by_alias=True)
         return super().default(o)
@@ -1,11 +1,43 @@
-import asyncio
 import os
-import sys
 
 
 import click
-from code_context.lsp_client import call_lsp
-from code_context.jedi_client import run_jedi
+
+# Command dependencies are imported inside each command, so that the CLI only pays for what it runs.
+
+transport_option = click.option(
+    "--transport",
+    type=click.Choice(["ws", "stdio"]),
+    default="ws",
+    help="ws connects to the server started by start-jedi, stdio runs a private server.",
+)
+
+deadline_options = [
+    click.option(
+        "--deadline",
+        default=None,
+        type=float,
+        help="Seconds the traversal may take. When reached, print the context resolved so far and what was skipped.",
+    ),
+    click.option(
+        "--request-timeout",
+        default=None,
+        type=float,
+        help="Seconds a single language server request may take before its call site is skipped.",
+    ),
+]
+
+stable_first_option = click.option(
+    "--stable-first",
+    is_flag=True,
+    help="Order snippets from rarely to frequently changed files, to keep the output prefix stable for prompt caching. Reports the stable prefix size on stderr.",
+)
+
+
+def with_deadline_options(command):
+    for option in reversed(deadline_options):
+        command = option(command)
+    return command
 
 
 @click.group()
@@ -16,7 +48,21 @@ def cli():
 @cli.command()
 @click.argument("file_and_function", required=True)
 @click.argument("depth", default=1, type=int)
-def lsp(file_and_function, depth):
+@click.option("--uri", default=None, help="Language server websocket uri.")
+@transport_option
+@click.option("--root", default=None, help="Project root of a stdio server.")
+@with_deadline_options
+@stable_first_option
+def lsp(
+    file_and_function,
+    depth,
+    uri,
+    transport,
+    root,
+    deadline,
+    request_timeout,
+    stable_first,
+):
     """
     Run the LSP client on a given file and optional function.
     Usage: lsp <file_name>::<function_name> <depth>
@@ -27,21 +73,133 @@ def lsp(file_and_function, depth):
         file_name = file_and_function
         function_name = None
 
-    asyncio.run(call_lsp(file_name, function_name, depth))
+    import asyncio
+    from code_context.lsp_client import call_lsp
+
+    asyncio.run(
+        call_lsp(
+            file_name,
+            function_name,
+            depth,
+            uri=uri,
+            transport=transport,
+            root_dir=root,
+            deadline=deadline,
+            request_timeout=request_timeout,
+            stable_first=stable_first,
+        )
+    )
+
+
+@cli.command()
+@click.argument("rev", required=False)
+@click.option("--depth", default=1, type=int, help="Depth of the call traversal.")
+@click.option("--uri", default=None, help="Language server websocket uri.")
+@transport_option
+@with_deadline_options
+@stable_first_option
+def diff(rev, depth, uri, transport, deadline, request_timeout, stable_first):
+    """
+    Run the LSP client on every function and class changed in git diff <rev> (HEAD by default).
+    Untracked python files, which git diff leaves out, count as changed in full.
+    Usage: diff [<rev>] [--depth <depth>]
+    """
+    import asyncio
+    from code_context.git_diff import get_repo_root
+    from code_context.lsp_client import call_lsp_diff
+
+    asyncio.run(
+        call_lsp_diff(
+            rev,
+            depth,
+            uri=uri,
+            transport=transport,
+            root_dir=get_repo_root(),
+            deadline=deadline,
+            request_timeout=request_timeout,
+            stable_first=stable_first,
+        )
+    )
+
+
+@cli.command()
+@click.argument("root_dir", type=click.Path(exists=True, file_okay=False))
+@click.argument("graph_path", type=click.Path())
+@click.option("--uri", default=None, help="Language server websocket uri.")
+@transport_option
+def index(root_dir, graph_path, uri, transport):
+    """
+    Resolve every call in the python files under root_dir and save the call graph.
+    Usage: index <root_dir> <graph_path>
+    """
+    import asyncio
+    from code_context.lsp_client import call_lsp_index
+
+    asyncio.run(call_lsp_index(root_dir, graph_path, uri=uri, transport=transport))
+
+
+@cli.command()
+@click.argument("graph_path", type=click.Path(exists=True, dir_okay=False))
+@click.argument("file_and_function", required=True)
+@click.argument("depth", default=1, type=int)
+def graph(graph_path, file_and_function, depth):
+    """
+    Same as lsp, answered from a call graph saved by index. Does not need the jedi server.
+    Usage: graph <graph_path> <file_name>::<function_name> <depth>
+    """
+    from code_context.call_graph import query_call_graph
+
+    if "::" not in file_and_function:
+        raise click.UsageError("graph needs a <file_name>::<function_name> target.")
+    file_name, function_name = file_and_function.split("::")
+    query_call_graph(graph_path, file_name, function_name, depth)
 
 
 @cli.command()
-@click.argument(
-    "root_dir",
-    type=click.Path(exists=True),
+@click.argument("recording", type=click.Path(dir_okay=False))
+@click.option("--record", is_flag=True, help="Record responses from --upstream.")
+@click.option("--upstream", default="ws://localhost:2087", help="Server to record.")
+@click.option("--port", default=2088, type=int)
+@click.option("--latency-ms", default=0.0, type=float, help="Injected latency.")
+@click.option("--jitter-ms", default=0.0, type=float, help="Uniform +/- jitter.")
+@click.option("--seed", default=0, type=int, help="Seed of the jitter.")
+def replay_server(recording, record, upstream, port, latency_ms, jitter_ms, seed):
+    """
+    Serve recorded language server responses, or record them from a running server.
+    Usage: replay-server <recording> [--record] [--latency-ms <ms>] [--jitter-ms <ms>]
+    """
+    import asyncio
+    from code_context.replay_server import run_replay_server
+
+    asyncio.run(
+        run_replay_server(
+            recording,
+            record=record,
+            upstream_uri=upstream,
+            port=port,
+            latency=latency_ms / 1000,
+            jitter=jitter_ms / 1000,
+            seed=seed,
+        )
+    )
+
+
+@cli.command()
+@click.argument("root_dir", required=False, type=click.Path(exists=True))
+@click.option(
+    "--warmup",
+    default=0,
+    type=int,
+    help="Warm jedi's caches for this many of the most imported modules before announcing readiness.",
 )
-def start_jedi(root_dir):
+def start_jedi(root_dir, warmup):
     """
     Start the Jedi client.
     """
-    print(sys.argv)
-    root_dir = sys.argv[2] if len(sys.argv) > 2 else None
-    asyncio.run(run_jedi(root_dir))
+    import asyncio
+    from code_context.jedi_client import run_jedi
+
+    asyncio.run(run_jedi(os.path.abspath(root_dir) if root_dir else None, warmup))
 
 
 if __name__ == "__main__":
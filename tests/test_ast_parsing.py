@@ -0,0 +1,88 @@
+from code_context.ast_parsing import (
+    definition_key,
+    find_definitions_and_calls,
+    find_definitions_in_line_ranges,
+    find_imported_module_names,
+)
+
+SOURCE = """
+class Outer:
+    def method(self):
+        helper()
+
+        def inner():
+            nested_helper()
+
+        return inner
+
+
+def function():
+    helper()
+"""
+
+
+def test_calls_attributed_to_innermost_definition(tmp_path):
+    file_path = tmp_path / "module.py"
+    file_path.write_text(SOURCE)
+    definitions, definition_calls = find_definitions_and_calls(str(file_path))
+    calls_by_name = {
+        node_info.name: {call.name for call in definition_calls[definition_key(node_info)]}
+        for node_info in definitions
+    }
+    assert calls_by_name == {
+        "Outer": set(),
+        "method": {"helper"},
+        "inner": {"nested_helper"},
+        "function": {"helper"},
+    }
+
+
+def test_find_imported_module_names_resolves_relative_imports():
+    source = "import os\nfrom . import sibling\nfrom ..core.models import Model\n"
+    assert find_imported_module_names(source, "pkg.sub") == [
+        "os",
+        "pkg.sub",
+        "pkg.sub.sibling",
+        "pkg.core.models",
+        "pkg.core.models.Model",
+    ]
+
+
+DECORATED_SOURCE = """import functools
+
+
+@functools.lru_cache
+def cached():
+    return 1
+
+
+class Outer:
+    @property
+    def value(self):
+        def inner():
+            return 2
+
+        return inner()
+
+    other = 3
+"""
+
+
+def test_changed_lines_map_to_innermost_definition(tmp_path):
+    file_path = tmp_path / "module.py"
+    file_path.write_text(DECORATED_SOURCE)
+
+    def names(ranges):
+        return [
+            n.name for n in find_definitions_in_line_ranges(str(file_path), ranges)
+        ]
+
+    # module level lines belong to no definition
+    assert names([(1, 1)]) == []
+    # a decorator line belongs to the definition it decorates
+    assert names([(4, 4)]) == ["cached"]
+    assert names([(11, 11)]) == ["value"]
+    # nested definitions win over their enclosing ones, overlapping and unsorted ranges are fine
+    assert names([(13, 13), (12, 14), (17, 17)]) == ["Outer", "value", "inner"]
+    # a whole file range, as for untracked files
+    assert names([(1, 17)]) == ["cached", "Outer", "value", "inner"]
@@ -0,0 +1,91 @@
+import pytest
+
+from code_context.call_graph import (
+    CallGraph,
+    CallGraphBuilder,
+    get_graph_code_context,
+    query_call_graph,
+)
+
+SOURCE = """def leaf():
+    pass
+
+
+def middle():
+    leaf()
+
+
+def root():
+    middle()
+"""
+
+
+def build_graph(uri: str) -> CallGraph:
+    builder = CallGraphBuilder()
+    leaf = builder.add_node(uri, "leaf", 1, 2)
+    middle = builder.add_node(uri, "middle", 5, 6)
+    root = builder.add_node(uri, "root", 9, 10)
+    builder.add_edge(root, middle)
+    builder.add_edge(middle, leaf)
+    builder.add_edge(leaf, root)
+    return builder.build()
+
+
+def test_reachable_by_depth():
+    graph = build_graph("file:///module.py")
+    root = graph.find("file:///module.py", "root")
+    assert graph.reachable([root], 0) == [[2]]
+    assert graph.reachable([root], 1) == [[2], [1]]
+    # the cycle back to root is not revisited
+    assert graph.reachable([root], 5) == [[2], [1], [0]]
+
+
+def test_save_and_load_round_trip(tmp_path):
+    graph = build_graph("file:///module.py")
+    path = tmp_path / "graph.ccg"
+    graph.save(str(path))
+    loaded = CallGraph.load(str(path))
+    assert loaded.files == graph.files
+    assert loaded.names == graph.names
+    assert [loaded.span(i) for i in range(len(loaded))] == [
+        graph.span(i) for i in range(len(graph))
+    ]
+    assert [list(loaded.callees(i)) for i in range(len(loaded))] == [[2], [0], [1]]
+
+
+def test_graph_code_context(tmp_path):
+    file_path = tmp_path / "module.py"
+    file_path.write_text(SOURCE)
+    uri = "file://" + str(file_path)
+    graph = build_graph(uri)
+    context = get_graph_code_context(graph, graph.find(uri, "root"), depth=1)
+    assert [snippet.splitlines()[1] for snippet in context] == [
+        "def middle():",
+        "def root():",
+    ]
+
+
+def test_load_rejects_other_item_size(tmp_path):
+    path = tmp_path / "graph.ccg"
+    build_graph("file:///module.py").save(str(path))
+    data = path.read_bytes()
+    # same length, so the header length stays valid
+    path.write_bytes(
+        data.replace(b'"itemsizes": {"span_file": 4', b'"itemsizes": {"span_file": 8')
+    )
+    with pytest.raises(ValueError, match="Rebuild"):
+        CallGraph.load(str(path))
+
+
+def test_query_refuses_stale_files(tmp_path, capsys):
+    file_path = tmp_path / "module.py"
+    file_path.write_text(SOURCE)
+    graph_path = str(tmp_path / "graph.ccg")
+    build_graph("file://" + str(file_path)).save(graph_path)
+    query_call_graph(graph_path, str(file_path), "root", 1)
+    assert "def middle():" in capsys.readouterr().out
+    # an edit moves every span below it
+    file_path.write_text("import os\n" + SOURCE)
+    with pytest.raises(SystemExit):
+        query_call_graph(graph_path, str(file_path), "root", 1)
+    assert "out of date" in capsys.readouterr().err
@@ -0,0 +1,81 @@
+import os
+import subprocess
+
+from code_context.git_diff import (
+    get_changed_line_ranges,
+    get_file_stabilities,
+    parse_diff_line_ranges,
+)
+
+DIFF = """diff --git a/pkg/module.py b/pkg/module.py
+index 1111111..2222222 100644
+--- a/pkg/module.py
++++ b/pkg/module.py
+@@ -10,0 +11,3 @@ def foo():
++    a = 1
++    b = 2
++    return a + b
+@@ -40,2 +43 @@ class Bar:
+-    x = 1
+-    y = 2
++    xy = 3
+@@ -60,4 +61,0 @@ def baz():
+-    pass
+diff --git a/old.py b/old.py
+deleted file mode 100644
+--- a/old.py
++++ /dev/null
+@@ -1,2 +0,0 @@
+-def gone():
+-    pass
+"""
+
+
+def test_parse_diff_line_ranges():
+    assert parse_diff_line_ranges(DIFF) == {
+        "pkg/module.py": [(11, 13), (43, 43), (61, 61)],
+    }
+
+
+def test_untracked_files_count_as_changed(tmp_path, monkeypatch):
+    subprocess.run(["git", "init", "-q"], cwd=tmp_path, check=True)
+    (tmp_path / "tracked.py").write_text("def old():\n    pass\n")
+    subprocess.run(["git", "add", "tracked.py"], cwd=tmp_path, check=True)
+    subprocess.run(
+        ["git", "-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qm", "init"],
+        cwd=tmp_path,
+        check=True,
+    )
+    (tmp_path / "new.py").write_text("def new():\n    pass\n\n")
+    monkeypatch.chdir(tmp_path)
+    root = subprocess.run(
+        ["git", "rev-parse", "--show-toplevel"], capture_output=True, text=True
+    ).stdout.strip()
+    assert get_changed_line_ranges() == {f"{root}/new.py": [(1, 3)]}
+
+
+def test_file_stabilities(tmp_path):
+    subprocess.run(["git", "init", "-q"], cwd=tmp_path, check=True)
+    root = subprocess.run(
+        ["git", "rev-parse", "--show-toplevel"],
+        capture_output=True,
+        text=True,
+        cwd=tmp_path,
+    ).stdout.strip()
+    # spaces and quotes would be quoted by git status without -z
+    committed, edited = f"{root}/old file.py", f'{root}/new "file".py'
+    for path, date in ((committed, 1_000_000_000), (edited, 1_100_000_000)):
+        with open(path, "w") as f:
+            f.write("pass\n")
+        subprocess.run(["git", "add", path], cwd=tmp_path, check=True)
+        subprocess.run(
+            ["git", "-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qm", "c"],
+            cwd=tmp_path,
+            check=True,
+            env={**os.environ, "GIT_COMMITTER_DATE": f"{date} +0000"},
+        )
+    with open(edited, "a") as f:
+        f.write("pass\n")
+    stabilities = get_file_stabilities([committed, edited])
+    assert stabilities[committed] == (True, 1_000_000_000)
+    assert stabilities[edited][0] is False
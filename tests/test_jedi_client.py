@@ -0,0 +1,88 @@
+import asyncio
+import json
+
+import pytest
+
+from code_context.jedi_client import LanguageServerClient, find_most_imported_files
+from code_context.replay_server import LSPReplayServer
+
+PORT = 2097
+
+PACKAGE = {
+    "pkg/__init__.py": "from .core import thing\n",
+    "pkg/core.py": "from . import util\nthing = 1\n",
+    "pkg/util.py": "x = y = 1\n",
+    "pkg/a.py": "from pkg import core\nfrom .util import x\n",
+    "pkg/b.py": "import pkg.util\n",
+    "pkg/c.py": "from .util import y\n",
+    "main.py": "import pkg\n",
+}
+
+
+def write_package(root):
+    for name, source in PACKAGE.items():
+        path = root / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_text(source)
+
+
+def test_find_most_imported_files(tmp_path):
+    write_package(tmp_path)
+    # util by core, a, b and c, the package by core (from .), a and main, core by the package and a
+    assert find_most_imported_files(str(tmp_path), 3) == [
+        str(tmp_path / "pkg/util.py"),
+        str(tmp_path / "pkg/__init__.py"),
+        str(tmp_path / "pkg/core.py"),
+    ]
+
+
+class CountingReplayServer(LSPReplayServer):
+    """Records which documents were requested and the most requests in flight at once."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.requested: list[str] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def _replay(self, websocket, message):
+        self.requested.append(message["params"]["textDocument"]["uri"])
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await super()._replay(websocket, message)
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.mark.asyncio
+async def test_warm_up_requests_every_file_within_the_concurrency_bound(
+    tmp_path, capsys
+):
+    write_package(tmp_path)
+    files = find_most_imported_files(str(tmp_path), 10)
+    recording = tmp_path / "recording.json"
+    recording.write_text(
+        json.dumps(
+            [
+                {
+                    "method": "textDocument/documentSymbol",
+                    "params": {"textDocument": {"uri": f"file://{filename}"}},
+                    "response": {"result": []},
+                }
+                for filename in files
+            ]
+        )
+    )
+    server = CountingReplayServer(str(recording), latency=0.05)
+    server_task = asyncio.create_task(server.serve("localhost", PORT))
+    await asyncio.sleep(0.1)
+    try:
+        lsp = LanguageServerClient(str(tmp_path))
+        lsp.uri = f"ws://localhost:{PORT}"
+        await lsp.warm_up(10, max_concurrent=2, requests_per_second=1000)
+    finally:
+        server_task.cancel()
+    assert sorted(server.requested) == sorted(f"file://{f}" for f in files)
+    assert server.max_in_flight == 2
+    assert "failed" not in capsys.readouterr().out
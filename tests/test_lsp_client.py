@@ -0,0 +1,394 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from code_context.ast_parsing import find_function_or_class_range
+from code_context.lsp_client import (
+    Deadline,
+    FileParser,
+    LSPClient,
+    call_lsp_diff,
+    connected_client,
+    find_changed_definitions,
+    LSPStdioClient,
+    LSPWebSocketClient,
+    get_depth_n_code_context,
+    order_stable_first,
+    report_stable_prefix,
+    start_deadline,
+)
+from code_context.replay_server import LSPReplayServer
+from code_context.response_types import NodeInfo, ObjectTypes, TypeDefinitionResponse
+
+PORT = 2095
+
+# Speaks Content-Length framed JSON-RPC on stdin/stdout like jedi-language-server. Before answering initialize it sends
+# a notification and a request of its own, and only answers once the client has replied to that request.
+FAKE_SERVER = r"""
+import json
+import sys
+
+
+def read():
+    length = None
+    while True:
+        line = sys.stdin.buffer.readline().strip()
+        if not line:
+            break
+        name, _, value = line.decode().partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    return json.loads(sys.stdin.buffer.read(length))
+
+
+def write(message):
+    body = json.dumps(message, ensure_ascii=False).encode()
+    sys.stdout.buffer.write(b"Content-Type: application/vscode-jsonrpc\r\n")
+    sys.stdout.buffer.write(b"Content-Length: %d\r\n\r\n" % len(body) + body)
+    sys.stdout.buffer.flush()
+
+
+while True:
+    message = read()
+    method = message.get("method")
+    if method == "initialize":
+        write({"jsonrpc": "2.0", "method": "window/logMessage", "params": {"message": "démarrage"}})
+        write({"jsonrpc": "2.0", "id": "server-1", "method": "workspace/configuration", "params": {}})
+        reply = read()
+        answered = reply == {"jsonrpc": "2.0", "id": "server-1", "result": None}
+        write({"jsonrpc": "2.0", "id": message["id"], "result": {"answered": answered}})
+    elif method == "initialized":
+        pass
+    elif method == "textDocument/documentSymbol":
+        write({"jsonrpc": "2.0", "id": message["id"], "result": []})
+    elif method == "shutdown":
+        write({"jsonrpc": "2.0", "id": message["id"], "result": None})
+    elif method == "exit":
+        sys.exit(0)
+"""
+
+
+@pytest.mark.asyncio
+async def test_stdio_client(tmp_path):
+    server = tmp_path / "fake_server.py"
+    server.write_text(FAKE_SERVER)
+    client = LSPStdioClient(str(tmp_path), command=(sys.executable, str(server)))
+    await client.connect()
+    try:
+        # the server request sent during initialize got a null reply, and the notification was skipped
+        response = await client.send_request(
+            "initialize", {"rootUri": f"file://{tmp_path}"}
+        )
+        assert response["result"] == {"answered": True}
+        assert await client.get_document_symbol(str(tmp_path / "module.py")) == []
+    finally:
+        await client.close()
+    # shutdown and exit were honoured, the process was not killed
+    assert client.process.returncode == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_connect_raises_the_connection_error():
+    # nothing listens on this port, close must not hide the refused connection
+    with pytest.raises(OSError):
+        async with connected_client("ws", "ws://localhost:1"):
+            pass
+
+
+@pytest.mark.asyncio
+async def test_stdio_close_after_server_exited():
+    client = LSPStdioClient(command=(sys.executable, "-c", "pass"))
+    with pytest.raises(ConnectionError):
+        await client.connect()
+    await client.process.wait()
+    await client.close()
+    assert client._reader_task is None
+
+
+class ReversingClient(LSPClient):
+    """In-memory transport whose server answers each batch of requests in reverse order of arrival."""
+
+    def __init__(self, batch_size: int):
+        super().__init__()
+        self.batch_size = batch_size
+        self.requests: list[dict] = []
+        self.incoming: asyncio.Queue = asyncio.Queue()
+
+    async def connect(self):
+        pass
+
+    async def send_message(self, message):
+        self.requests.append(message)
+        if len(self.requests) == self.batch_size:
+            for request in reversed(self.requests):
+                # a notification in between must not be taken for a response
+                await self.incoming.put({"jsonrpc": "2.0", "method": "window/logMessage"})
+                await self.incoming.put(
+                    {"jsonrpc": "2.0", "id": request["id"], "result": request["params"]}
+                )
+
+    async def receive_message(self):
+        return await self.incoming.get()
+
+    async def close(self):
+        await self._stop_reading()
+
+
+@pytest.mark.asyncio
+async def test_out_of_order_responses_reach_their_requests():
+    client = ReversingClient(batch_size=5)
+    try:
+        responses = await asyncio.gather(
+            *(client.send_request("test/echo", {"n": n}) for n in range(5))
+        )
+    finally:
+        await client.close()
+    assert [response["result"] for response in responses] == [
+        {"n": n} for n in range(5)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_parsing_does_not_block_the_event_loop(tmp_path):
+    module = tmp_path / "large.py"
+    source = "".join(
+        f"def f{i}(x):\n    return f{i + 1}(x) + [x] * {i}\n\n" for i in range(10_000)
+    )
+    module.write_text(source)
+    file_parser = FileParser()
+    largest_gap = 0.0
+    ticks = 0
+
+    async def tick():
+        nonlocal largest_gap, ticks
+        last = time.perf_counter()
+        while True:
+            await asyncio.sleep(0.005)
+            now = time.perf_counter()
+            largest_gap = max(largest_gap, now - last)
+            last = now
+            ticks += 1
+
+    ticker = asyncio.create_task(tick())
+    start = time.perf_counter()
+    try:
+        node_info = await file_parser.find_definition(f"file://{module}", 3 * 1000)
+    finally:
+        ticker.cancel()
+    parse_time = time.perf_counter() - start
+    assert node_info.name == "f1000" and node_info.end_line == 3002
+    # the loop kept running while the file was parsed, a thread holding the GIL stalls it for most of the parse
+    assert ticks > 10
+    assert largest_gap < parse_time / 4
+
+
+async def slow_query(tmp_path, port: int, deadline=None, request_timeout=None):
+    """Depth 2 query of a function calling helper, against a server that answers every request after 5 seconds."""
+    module = tmp_path / "module.py"
+    module.write_text("def helper():\n    pass\n\n\ndef target():\n    helper()\n")
+    server = LSPReplayServer(str(tmp_path / "recording.json"), latency=5.0)
+    server_task = asyncio.create_task(server.serve("localhost", port))
+    await asyncio.sleep(0.1)
+    client = LSPWebSocketClient(f"ws://localhost:{port}")
+    await client.connect()
+    try:
+        traversal_deadline = start_deadline(client, deadline, request_timeout)
+        node_info = find_function_or_class_range(str(module), "target")
+        context = await get_depth_n_code_context(
+            client, [node_info], depth=2, deadline=traversal_deadline
+        )
+        return context, traversal_deadline
+    finally:
+        await client.close()
+        server_task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_deadline_returns_partial_context(tmp_path):
+    context, deadline = await slow_query(tmp_path, PORT, deadline=0.2)
+    assert isinstance(deadline, Deadline)
+    assert len(context) == 1
+    assert [call.name for call in deadline.skipped_calls] == ["helper"]
+    assert deadline.note().startswith("# Deadline of 0.2s reached")
+    assert "helper" in deadline.note()
+
+
+@pytest.mark.asyncio
+async def test_request_timeout_without_deadline(tmp_path):
+    context, deadline = await slow_query(tmp_path, PORT + 1, request_timeout=0.2)
+    assert len(context) == 1
+    assert [call.name for call in deadline.skipped_calls] == ["helper"]
+    assert deadline.note().startswith("# Some requests timed out")
+
+
+HELPERS_SOURCE = """def b_helper():
+    pass
+
+
+def a_helper():
+    pass
+
+
+def target():
+    b_helper()
+    a_helper()
+"""
+
+
+class DelayedDefinitionClient(LSPClient):
+    """Resolves calls to the helpers in HELPERS_SOURCE, each after its own delay, so the order in which calls resolve
+    can be chosen."""
+
+    def __init__(self, module_path: str, delays: dict[str, float]):
+        super().__init__()
+        self.module_path = module_path
+        self.delays = delays
+        self.lines = HELPERS_SOURCE.splitlines()
+
+    async def connect(self):
+        pass
+
+    async def send_message(self, message):
+        pass
+
+    async def receive_message(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def get_type_definition(self, text_document, position):
+        name = self.lines[position.line].strip().removesuffix("()")
+        await asyncio.sleep(self.delays[name])
+        line = self.lines.index(f"def {name}():")
+        location = {
+            "uri": f"file://{self.module_path}",
+            "range": {
+                "start": {"line": line, "character": 4},
+                "end": {"line": line, "character": 4 + len(name)},
+            },
+        }
+        return TypeDefinitionResponse.model_validate({"result": [location]})
+
+
+@pytest.mark.asyncio
+async def test_canonical_order_does_not_depend_on_resolution_order(tmp_path):
+    module = tmp_path / "module.py"
+    module.write_text(HELPERS_SOURCE)
+    node_info = find_function_or_class_range(str(module), "target")
+    contexts = []
+    for delays in (
+        {"a_helper": 0.0, "b_helper": 0.05},
+        {"a_helper": 0.05, "b_helper": 0.0},
+    ):
+        client = DelayedDefinitionClient(str(module), delays)
+        contexts.append(await get_depth_n_code_context(client, [node_info], depth=1))
+    assert contexts[0] == contexts[1]
+    # depth 1 before the target, each depth by (uri, line)
+    assert [snippet.splitlines()[1] for snippet in contexts[0]] == [
+        "def b_helper():",
+        "def a_helper():",
+        "def target():",
+    ]
+
+
+def git(repo, *args, date=None):
+    env = dict(os.environ)
+    if date is not None:
+        env["GIT_AUTHOR_DATE"] = env["GIT_COMMITTER_DATE"] = f"{date} +0000"
+    subprocess.run(
+        ["git", "-c", "user.name=t", "-c", "user.email=t@t", *args],
+        cwd=repo,
+        env=env,
+        check=True,
+        capture_output=True,
+    )
+
+
+def definition(uri: str, line: int = 1) -> NodeInfo:
+    return NodeInfo(
+        uri=uri,
+        name="f",
+        kind=ObjectTypes.FUNCTION,
+        line=line,
+        character=0,
+        end_line=line + 1,
+    )
+
+
+def test_order_stable_first(tmp_path, monkeypatch):
+    git(tmp_path, "init", "-q")
+    # old.py, then target.py, then new.py are committed, dirty.py never is
+    commits = [
+        (1_000_000_000, "old.py"),
+        (1_100_000_000, "target.py"),
+        (1_200_000_000, "new.py"),
+    ]
+    for date, name in commits:
+        (tmp_path / name).write_text("def f():\n    pass\n")
+        git(tmp_path, "add", name)
+        git(tmp_path, "commit", "-qm", name, date=date)
+    (tmp_path / "dirty.py").write_text("def f():\n    pass\n")
+    monkeypatch.chdir(tmp_path)
+    root = subprocess.run(
+        ["git", "rev-parse", "--show-toplevel"], capture_output=True, text=True
+    ).stdout.strip()
+    # the target is given by relative path, as lsp does, its callees come back as file:// uris
+    target = definition("target.py", line=10)
+    old, new, dirty = (
+        definition(f"file://{root}/{name}")
+        for name in ("old.py", "new.py", "dirty.py")
+    )
+
+    ordered, stable_count = order_stable_first([target, dirty, new, old], [target])
+    assert ordered == [old, new, dirty, target]
+    # the prefix stops at the first uncommitted file
+    assert stable_count == 2
+
+    target_file_callee = definition(f"file://{root}/target.py")
+    ordered, stable_count = order_stable_first(
+        [target, dirty, new, old, target_file_callee], [target]
+    )
+    assert ordered == [old, target_file_callee, new, dirty, target]
+    # and at the first snippet from a target's file
+    assert stable_count == 1
+
+
+def test_report_stable_prefix(capsys):
+    # snippets are joined by two newlines, and counted in bytes, not characters
+    report_stable_prefix(["ab", "\u00e9", "c"], 1)
+    assert capsys.readouterr().err == "Stable prefix: 4 of 9 bytes (1 of 3 snippets)\n"
+
+
+def committed_repo(tmp_path):
+    git(tmp_path, "init", "-q")
+    (tmp_path / "module.py").write_text("def f():\n    g()\n")
+    git(tmp_path, "add", "module.py")
+    git(tmp_path, "commit", "-qm", "init")
+
+
+@pytest.mark.asyncio
+async def test_empty_diff_needs_no_server(tmp_path, monkeypatch, capsys):
+    committed_repo(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    # nothing listens on this port, connecting would fail
+    await call_lsp_diff(None, 1, uri="ws://localhost:1")
+    captured = capsys.readouterr()
+    assert captured.out == ""
+    assert captured.err == "No changed functions or classes found.\n"
+
+
+def test_changed_definitions_skip_unparseable_files(tmp_path, monkeypatch, capsys):
+    committed_repo(tmp_path)
+    (tmp_path / "module.py").write_text("def f():\n    g()\n    h()\n")
+    (tmp_path / "broken.py").write_text("def f(:\n")
+    monkeypatch.chdir(tmp_path)
+    changed_definitions, definition_calls = find_changed_definitions(None)
+    assert [n.name for n in changed_definitions] == ["f"]
+    [calls] = definition_calls.values()
+    assert {call.name for call in calls} == {"g", "h"}
+    assert "Skipping" in capsys.readouterr().err
@@ -0,0 +1,95 @@
+import asyncio
+import json
+
+import pytest
+
+from code_context.lsp_client import LSPWebSocketClient
+from code_context.replay_server import LSPReplayServer
+from code_context.response_types import Position, TextDocument
+
+PORT = 2090
+
+
+@pytest.mark.asyncio
+async def test_replays_recorded_response(tmp_path):
+    recording = tmp_path / "recording.json"
+    params = {
+        "textDocument": {"uri": "file:///module.py"},
+        "position": {"line": 3, "character": 5},
+    }
+    location = {
+        "uri": "file:///other.py",
+        "range": {
+            "start": {"line": 0, "character": 4},
+            "end": {"line": 0, "character": 9},
+        },
+    }
+    recording.write_text(
+        json.dumps(
+            [
+                {
+                    "method": "textDocument/typeDefinition",
+                    "params": params,
+                    "response": {"result": [location]},
+                }
+            ]
+        )
+    )
+    server = LSPReplayServer(str(recording), latency=0.01, jitter=0.005)
+    server_task = asyncio.create_task(server.serve("localhost", PORT))
+    await asyncio.sleep(0.1)
+    client = LSPWebSocketClient(f"ws://localhost:{PORT}")
+    await client.connect()
+    try:
+        response = await client.get_type_definition(
+            TextDocument(uri="file:///module.py"), Position(line=3, character=5)
+        )
+        assert response.result[0].uri == "file:///other.py"
+        # unrecorded requests get an error instead of hanging
+        missing = await client.send_request("textDocument/hover", params)
+        assert missing["error"]["message"].startswith("No recorded response")
+    finally:
+        await client.close()
+        server_task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_records_session_on_disconnect(tmp_path):
+    params = {"textDocument": {"uri": "file:///module.py"}}
+    upstream_recording = tmp_path / "upstream.json"
+    upstream_recording.write_text(
+        json.dumps(
+            [
+                {
+                    "method": "textDocument/documentSymbol",
+                    "params": params,
+                    "response": {"result": []},
+                }
+            ]
+        )
+    )
+    # another replay server stands in for jedi
+    upstream = LSPReplayServer(str(upstream_recording))
+    recorder = LSPReplayServer(
+        str(tmp_path / "recording.json"),
+        record=True,
+        upstream_uri=f"ws://localhost:{PORT + 2}",
+    )
+    upstream_task = asyncio.create_task(upstream.serve("localhost", PORT + 2))
+    recorder_task = asyncio.create_task(recorder.serve("localhost", PORT + 3))
+    await asyncio.sleep(0.1)
+    client = LSPWebSocketClient(f"ws://localhost:{PORT + 3}")
+    await client.connect()
+    try:
+        response = await client.send_request("textDocument/documentSymbol", params)
+        assert response["result"] == []
+        assert not (tmp_path / "recording.json").exists()
+        await client.close()
+        await asyncio.sleep(0.1)
+        assert json.loads((tmp_path / "recording.json").read_text()) == json.loads(
+            upstream_recording.read_text()
+        )
+    finally:
+        recorder_task.cancel()
+        upstream_task.cancel()
+
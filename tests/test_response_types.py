@@ -0,0 +1,15 @@
+import warnings
+
+from code_context.response_types import VisitedNode
+
+
+def test_visited_nodes_hash_and_compare_by_value():
+    node = VisitedNode(uri="file:///a.py", name="f", line=1, character=2)
+    same = VisitedNode(uri="file:///a.py", name="f", line=1, character=2)
+    other = VisitedNode(uri="file:///a.py", name="f", line=3, character=2)
+    with warnings.catch_warnings():
+        # reading model_fields from an instance is deprecated in pydantic 2.11
+        warnings.simplefilter("error")
+        assert node == same and hash(node) == hash(same)
+        assert node != other
+        assert len({node, same, other}) == 2
@@ -0,0 +1,13 @@
+from code_context.utils import find_uncontained_spans
+
+
+def test_find_uncontained_spans():
+    spans = [
+        ("file:///a.py", 3, 5),  # method, contained in the class below
+        ("file:///a.py", 1, 10),  # class
+        ("file:///b.py", 3, 5),  # same lines in another file
+        ("file:///a.py", 1, 10),  # duplicate of the class
+        ("file:///a.py", 8, 12),  # overlaps the class without being contained
+        ("file:///a.py", 12, 12),  # contained in the previous span
+    ]
+    assert find_uncontained_spans(spans) == [1, 2, 4]